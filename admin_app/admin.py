@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Book
+from .models import Category, Book, Order, OrderItem
 
 # Register your models here.
 
@@ -14,3 +14,16 @@ class BookAdmin(admin.ModelAdmin):
     list_filter = ['category', 'created_at']
     search_fields = ['title', 'author']
     date_hierarchy = 'created_at'
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ['book']
+    extra = 0
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'total_price', 'created_at', 'expires_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+    inlines = [OrderItemInline]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdminAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'admin_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,318 @@
+"""Search-as-you-type suggestions without touching the database.
+
+The shared state lives in the cache:
+
+* a snapshot: a zlib-compressed JSON list of ``[id, title, author]`` for
+  every available book, tagged with a generation;
+* a change log: one entry per ``update_books`` call, keyed by generation and
+  sequence number;
+* the head, ``[generation, sequence]``, naming the latest change.
+
+Each worker keeps a ``PrefixIndex`` of normalised keys, bucketed by their
+first two characters and kept sorted for ``bisect``. A lookup reads the head.
+If other workers logged changes since, it fetches just those entries and
+patches the index in place. A new generation comes from ``rebuild``, which
+``update_books`` also runs once the log reaches ``COMPACT_AFTER`` entries.
+Each worker loads its first index, and every later generation, in a
+background thread while the index it already has keeps answering.
+
+The lookup path never reads the database. When the snapshot or a log entry
+is missing, a rebuild is scheduled and the current index is served meanwhile.
+
+Without a shared cache each worker only sees its own log, so the keys expire
+after ``AUTOCOMPLETE_CACHE_TIMEOUT`` and a generation older than that is
+rebuilt, bringing in the other workers' edits.
+
+Writers never wait for the snapshot lock. One that finds it taken sets a
+pending flag, and the holder schedules a rebuild once it lets go.
+"""
+import bisect
+import json
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Book
+
+SNAPSHOT_KEY = 'autocomplete:snapshot'
+HEAD_KEY = 'autocomplete:head'
+LOCK_KEY = 'autocomplete:lock'
+REBUILD_KEY = 'autocomplete:rebuilding'
+PENDING_KEY = 'autocomplete:pending'
+
+MIN_QUERY_LENGTH = 2
+LIMIT = 10
+# Matches examined per query before ranking
+SCAN_LIMIT = 200
+# Logged changes after which update_books writes a fresh snapshot instead
+COMPACT_AFTER = 1000
+# Seconds a rebuild may hold the snapshot lock, and between scheduled rebuilds
+REBUILD_TIMEOUT = 300
+
+# Lower sorts first: whole-title prefixes, then later title words, then authors
+TITLE, TITLE_WORD, AUTHOR = 0, 1, 2
+
+
+def normalize(text):
+    """Case- and accent-insensitive form used for keys and queries"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+def change_key(generation, sequence):
+    return f'autocomplete:change:{generation}:{sequence}'
+
+
+class PrefixIndex:
+    """Sorted ``(key, kind, book_id)`` entries bucketed by the key's first two
+    characters. Queries are at least that long, so each one searches a single
+    bucket, and patching a book only shifts the few small buckets it is in.
+    """
+
+    def __init__(self, books=()):
+        self.books = {}
+        self.buckets = {}
+        entries = []
+        for book_id, title, author in books:
+            self.books[book_id] = (title, author)
+            entries += self.entries(book_id, title, author)
+        entries.sort()
+        for entry in entries:
+            self.buckets.setdefault(entry[0][:MIN_QUERY_LENGTH], []).append(entry)
+
+    @staticmethod
+    def entries(book_id, title, author):
+        words = normalize(title).split(' ')
+        entries = [
+            (' '.join(words[position:]), TITLE if position == 0 else TITLE_WORD, book_id)
+            for position in range(len(words))
+        ]
+        entries.append((normalize(author), AUTHOR, book_id))
+        return entries
+
+    def add(self, book_id, title, author):
+        self.remove(book_id)
+        self.books[book_id] = (title, author)
+        for entry in self.entries(book_id, title, author):
+            bisect.insort(self.buckets.setdefault(entry[0][:MIN_QUERY_LENGTH], []), entry)
+
+    def remove(self, book_id):
+        book = self.books.pop(book_id, None)
+        if book is None:
+            return
+        for entry in self.entries(book_id, *book):
+            bucket = self.buckets.get(entry[0][:MIN_QUERY_LENGTH], [])
+            position = bisect.bisect_left(bucket, entry)
+            if position < len(bucket) and bucket[position] == entry:
+                del bucket[position]
+
+    def apply(self, changes):
+        """Apply a change log entry: ``[id, title, author]`` upserts, ``[id]`` removes"""
+        for change in changes:
+            if len(change) == 3:
+                self.add(*change)
+            else:
+                self.remove(change[0])
+
+    def search(self, query, limit=LIMIT):
+        query = normalize(query)
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        bucket = self.buckets.get(query[:MIN_QUERY_LENGTH], [])
+        start = bisect.bisect_left(bucket, (query,))
+        end = bisect.bisect_right(bucket, (query + '\uffff',), lo=start, hi=min(start + SCAN_LIMIT, len(bucket)))
+        best = {}
+        for key, kind, book_id in bucket[start:end]:
+            if kind < best.get(book_id, AUTHOR + 1):
+                best[book_id] = kind
+        # Another thread may be patching the index; skip books removed meanwhile
+        found = {book_id: self.books.get(book_id) for book_id in best}
+        ranked = sorted(
+            (book_id for book_id, book in found.items() if book is not None),
+            key=lambda book_id: (best[book_id], len(found[book_id][0]), book_id),
+        )
+        return [
+            {'id': book_id, 'title': found[book_id][0], 'author': found[book_id][1]}
+            for book_id in ranked[:limit]
+        ]
+
+
+EMPTY_INDEX = PrefixIndex()
+
+
+def dump(snapshot):
+    return zlib.compress(json.dumps(snapshot, separators=(',', ':')).encode())
+
+
+def load(snapshot):
+    return json.loads(zlib.decompress(snapshot))
+
+
+def _available(book_ids=None):
+    books = Book.objects.filter(is_available=True)
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+    return [list(row) for row in books.order_by('id').values_list('id', 'title', 'author').iterator()]
+
+
+@contextmanager
+def _snapshot_lock():
+    """Serialize snapshot and change log writers across workers without waiting.
+
+    Yields whether the lock was taken. It expires after REBUILD_TIMEOUT in case
+    its holder dies, and only the call that took it releases it.
+    """
+    token = uuid.uuid4().hex
+    acquired = cache.add(LOCK_KEY, token, REBUILD_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            if cache.get(LOCK_KEY) == token:
+                cache.delete(LOCK_KEY)
+            # Writers that found the lock taken left their changes to us
+            if cache.get(PENDING_KEY):
+                _schedule_rebuild()
+
+
+def _defer():
+    """Leave a write to the lock holder, which rebuilds once it lets go"""
+    cache.set(PENDING_KEY, 1, REBUILD_TIMEOUT)
+    # The holder may have let go before the flag was set
+    if cache.get(LOCK_KEY) is None:
+        _schedule_rebuild()
+
+
+def rebuild():
+    """Write a new snapshot generation from the database; returns the number of
+    books, or None when another writer holds the lock and it rebuilds instead
+    """
+    timeout = settings.AUTOCOMPLETE_CACHE_TIMEOUT
+    with _snapshot_lock() as acquired:
+        if not acquired:
+            # Clear the schedule guard so the holder can schedule the retry
+            cache.delete(REBUILD_KEY)
+            _defer()
+            return None
+        cache.delete(PENDING_KEY)
+        head = cache.get(HEAD_KEY)
+        books = _available()
+        # A timestamp rather than a counter so a cache flush never reuses an old generation
+        generation = time.time_ns()
+        cache.set(SNAPSHOT_KEY, dump({'generation': generation, 'books': books}), timeout)
+        cache.set(HEAD_KEY, [generation, 0], timeout)
+        if head is not None:
+            cache.delete_many([change_key(head[0], sequence) for sequence in range(1, head[1] + 1)])
+        cache.delete(REBUILD_KEY)
+    return len(books)
+
+
+def update_books(book_ids):
+    """Log the current state of ``book_ids`` for every worker to apply"""
+    timeout = settings.AUTOCOMPLETE_CACHE_TIMEOUT
+    with _snapshot_lock() as acquired:
+        if not acquired:
+            _defer()
+            return
+        head = cache.get(HEAD_KEY)
+        if head is not None and head[1] < COMPACT_AFTER:
+            book_ids = set(book_ids)
+            changes = _available(book_ids)
+            changes += [[book_id] for book_id in book_ids - {book[0] for book in changes}]
+            generation, sequence = head[0], head[1] + 1
+            cache.set(change_key(generation, sequence), changes, timeout)
+            cache.set(HEAD_KEY, [generation, sequence], timeout)
+            return
+    # The new snapshot reads these books' current rows
+    _schedule_rebuild()
+
+
+def _schedule_rebuild():
+    """Rebuild off the request path, at most once per REBUILD_TIMEOUT across workers"""
+    if not cache.add(REBUILD_KEY, 1, REBUILD_TIMEOUT):
+        return
+    from .tasks import rebuild_autocomplete, send_in_background  # tasks imports this module
+    send_in_background(rebuild_autocomplete)
+
+
+# This process's (generation, sequence, index)
+_current = (None, 0, None)
+_lock = threading.Lock()
+# Thread loading a new generation while the old index keeps serving
+_loader = None
+
+
+def _catch_up(state, head):
+    """``state`` advanced to ``head`` by applying the logged changes in place"""
+    generation, sequence, index = state
+    if head is None or head[0] != generation or head[1] <= sequence:
+        return state
+    keys = [change_key(generation, number) for number in range(sequence + 1, head[1] + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        # Evicted from the cache: only a new snapshot can bring us up to date
+        _schedule_rebuild()
+        return state
+    for key in keys:
+        index.apply(changes[key])
+    return (generation, head[1], index)
+
+
+def _load():
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        _schedule_rebuild()
+        return None
+    snapshot = load(snapshot)
+    state = (snapshot['generation'], 0, PrefixIndex(snapshot['books']))
+    return _catch_up(state, cache.get(HEAD_KEY))
+
+
+def _load_in_background():
+    global _current, _loader
+    try:
+        state = _load()
+        if state is not None:
+            with _lock:
+                _current = state
+    finally:
+        _loader = None
+
+
+def _expired(generation):
+    """Whether a generation predates edits that only a rebuild brings in (no shared cache)"""
+    timeout = settings.AUTOCOMPLETE_CACHE_TIMEOUT
+    return timeout is not None and time.time_ns() - generation > timeout * 10**9
+
+
+def get_index():
+    """This worker's index, brought up to date with the changes other workers logged"""
+    global _current, _loader
+    head = cache.get(HEAD_KEY)
+    if head is None or _expired(head[0]):
+        _schedule_rebuild()
+    if head is None:
+        return _current[2] or EMPTY_INDEX
+    if head[0] == _current[0]:
+        if head[1] > _current[1]:
+            with _lock:
+                _current = _catch_up(_current, head)
+    else:
+        # A new generation, or this process's first lookup: the current index
+        # (empty at first) answers while the new one is built
+        with _lock:
+            if _loader is None:
+                _loader = threading.Thread(target=_load_in_background, daemon=True)
+                _loader.start()
+    return _current[2] or EMPTY_INDEX
+
+
+def suggest(query, limit=LIMIT):
+    return get_index().search(query, limit)
@@ -0,0 +1,51 @@
+"""Version keys for cached catalogue fragments, and per-user wishlist sets.
+
+Cached fragments include the current catalogue version in their key. Any
+Book or Category change bumps the version (see ``admin_app.signals``), which
+orphans every fragment built from the old data without having to know or
+delete their keys.
+
+Each user's wishlisted book ids are cached as one set, so a page of N books
+can be marked up without touching the database; wishlist changes delete it.
+Deletes only reach other workers through a shared cache, so the timeout
+(``WISHLIST_CACHE_TIMEOUT``) is short unless Redis is configured.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+WISHLIST_KEY = 'wishlist:{}:ids'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = bump_catalog_version()
+    return version
+
+
+def bump_catalog_version():
+    # A timestamp rather than a counter so a cache flush never reuses an old version
+    version = time.time_ns()
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def get_wishlisted_ids(user_id):
+    """Set of ids of the books on ``user_id``'s wishlist"""
+    key = WISHLIST_KEY.format(user_id)
+    book_ids = cache.get(key)
+    if book_ids is None:
+        from .models import Wishlist
+
+        book_ids = set(
+            Wishlist.books.through.objects.filter(wishlist__user_id=user_id).values_list('book_id', flat=True)
+        )
+        cache.set(key, book_ids, settings.WISHLIST_CACHE_TIMEOUT)
+    return book_ids
+
+
+def invalidate_wishlist(user_id):
+    cache.delete(WISHLIST_KEY.format(user_id))
@@ -0,0 +1,175 @@
+"""Faceted catalogue navigation.
+
+Options within a facet are ORed and facets are ANDed together. Each facet's
+counts are computed with every *other* active facet applied, so the counts
+say how many books a click would leave. Each facet costs one grouped or
+conditional-aggregate query. The whole result is cached under the filter
+signature plus the catalogue version, so any catalogue change invalidates
+it.
+"""
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .caching import get_catalog_version
+from .models import Book, Category
+
+# key -> (label, min inclusive, max exclusive)
+PRICE_BUCKETS = {
+    'under-10': ('Under $10', None, Decimal('10')),
+    '10-25': ('$10 - $25', Decimal('10'), Decimal('25')),
+    '25-50': ('$25 - $50', Decimal('25'), Decimal('50')),
+    '50-plus': ('$50 & above', Decimal('50'), None),
+}
+
+# key -> (label, minimum average rating); bands overlap, so only one applies
+RATING_BANDS = {
+    '4': ('4★ & up', 4),
+    '3': ('3★ & up', 3),
+    '2': ('2★ & up', 2),
+    '1': ('1★ & up', 1),
+}
+
+FIELD_FACETS = {
+    'category': ('Category', 'category'),
+    'language': ('Language', 'language'),
+    'condition': ('Condition', 'condition'),
+    'publisher': ('Publisher', 'publisher'),
+}
+FACET_LABELS = {**{name: label for name, (label, field) in FIELD_FACETS.items()}, 'price': 'Price', 'rating': 'Rating'}
+FACET_NAMES = list(FACET_LABELS)
+
+# Long tails (publishers) are cut to the most common values
+MAX_OPTIONS = 15
+
+
+def selected_facets(params):
+    """{facet: [values]} from request.GET, dropping anything malformed"""
+    selected = {}
+    for name in FACET_NAMES:
+        values = [value.strip() for value in params.getlist(name) if value.strip()][:MAX_OPTIONS]
+        if name == 'category':
+            values = [value for value in values if value.isdigit()]
+        elif name == 'condition':
+            values = [value for value in values if value in dict(Book.CONDITION_CHOICES)]
+        elif name == 'price':
+            values = [value for value in values if value in PRICE_BUCKETS]
+        elif name == 'rating':
+            values = [value for value in values if value in RATING_BANDS][:1]
+        else:
+            values = [value[:200] for value in values]
+        if values:
+            selected[name] = sorted(set(values))
+    return selected
+
+
+def price_q(key):
+    label, low, high = PRICE_BUCKETS[key]
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def rating_q(key):
+    return Q(average_rating__gte=RATING_BANDS[key][1])
+
+
+def facet_q(name, values):
+    if name in FIELD_FACETS:
+        return Q(**{f'{FIELD_FACETS[name][1]}__in': values})
+    make_q = price_q if name == 'price' else rating_q
+    q = Q()
+    for value in values:
+        q |= make_q(value)
+    return q
+
+
+def apply_facets(queryset, selected, exclude=None):
+    for name, values in selected.items():
+        if name != exclude:
+            queryset = queryset.filter(facet_q(name, values))
+    return queryset
+
+
+def compute_facet_counts(base, selected):
+    """{facet: {value: count}} for every facet"""
+    counts = {}
+    for name, (label, field) in FIELD_FACETS.items():
+        queryset = apply_facets(base, selected, exclude=name)
+        queryset = queryset.exclude(category=None) if name == 'category' else queryset.exclude(**{field: ''})
+        rows = queryset.values_list(field).annotate(count=Count('id')).order_by('-count')[:MAX_OPTIONS]
+        counts[name] = {str(value): count for value, count in rows}
+
+    bucket_qs = {
+        'price': {key: price_q(key) for key in PRICE_BUCKETS},
+        'rating': {key: rating_q(key) for key in RATING_BANDS},
+    }
+    # Both bucket facets see the same queryset unless one of them is active,
+    # so they usually share a single aggregate query
+    groups = [['price', 'rating']] if not {'price', 'rating'} & set(selected) else [['price'], ['rating']]
+    for names in groups:
+        queryset = apply_facets(base, selected, exclude=names[0])
+        aggregates = {
+            f'{name}:{key}': Count('id', filter=q)
+            for name in names
+            for key, q in bucket_qs[name].items()
+        }
+        for alias, count in queryset.aggregate(**aggregates).items():
+            name, key = alias.split(':')
+            counts.setdefault(name, {})[key] = count
+    return counts
+
+
+def facet_labels(counts):
+    """{facet: {value: label}} for the values present in ``counts``"""
+    categories = Category.objects.filter(pk__in=[int(value) for value in counts['category']])
+    return {
+        'category': {str(pk): name for pk, name in categories.values_list('pk', 'category_name')},
+        'condition': dict(Book.CONDITION_CHOICES),
+        'price': {key: label for key, (label, low, high) in PRICE_BUCKETS.items()},
+        'rating': {key: label for key, (label, minimum) in RATING_BANDS.items()},
+    }
+
+
+def get_facets(base, selected, signature):
+    """Facets for display: [{'name', 'label', 'options': [{'value', 'label', 'count', 'selected'}]}].
+
+    ``signature`` identifies ``base`` (the search and other non-facet filters)
+    in the cache key.
+    """
+    digest = hashlib.sha1(json.dumps([signature, selected], sort_keys=True, default=str).encode()).hexdigest()
+    key = f'facets:{get_catalog_version()}:{digest}'
+    cached = cache.get(key)
+    if cached is None:
+        counts = compute_facet_counts(base, selected)
+        cached = (counts, facet_labels(counts))
+        cache.set(key, cached, settings.FACET_CACHE_TIMEOUT)
+    counts, labels = cached
+
+    facets = []
+    for name in FACET_NAMES:
+        chosen = selected.get(name, [])
+        options = [
+            {
+                'value': value,
+                'label': labels.get(name, {}).get(value, value),
+                'count': count,
+                'selected': value in chosen,
+            }
+            for value, count in counts.get(name, {}).items()
+            if count or value in chosen
+        ]
+        options += [
+            {'value': value, 'label': labels.get(name, {}).get(value, value), 'count': 0, 'selected': True}
+            for value in chosen if value not in counts.get(name, {})
+        ]
+        if options:
+            facets.append({'name': name, 'label': FACET_LABELS[name], 'options': options})
+    return facets
@@ -1,8 +1,17 @@
 from django import forms
 from django.contrib.auth.models import User
 from .models import * 
+from .isbn import normalize_isbn
 
 class BookForm(forms.ModelForm):
+    # Wider than the model column so hyphenated ISBNs can be entered
+    isbn = forms.CharField(
+        max_length=17,
+        required=False,
+        label='ISBN',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter ISBN-10 or ISBN-13'})
+    )
+
     class Meta:
         model = Book
         fields = [
@@ -14,7 +23,6 @@ class BookForm(forms.ModelForm):
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter book title'}),
             'author': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter author name'}),
-            'isbn': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter 13-digit ISBN'}),
             'category': forms.Select(attrs={'class': 'form-control'}),
             'price': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
             'original_price': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
@@ -47,6 +55,15 @@ class BookForm(forms.ModelForm):
             'is_featured': 'Feature on Homepage',
         }
 
+    def clean_isbn(self):
+        isbn = self.cleaned_data.get('isbn')
+        if not isbn:
+            return None
+        normalized = normalize_isbn(isbn)
+        if normalized is None:
+            raise forms.ValidationError('Enter a valid ISBN-10 or ISBN-13.')
+        return normalized
+
 
 class CategoryForm(forms.ModelForm):
     class Meta:
@@ -93,16 +110,13 @@ class BookSearchForm(forms.Form):
         widget=forms.TextInput(attrs={
             'class': 'form-control',
             'placeholder': 'Search books by title, author, or ISBN...',
-            'autocomplete': 'off'
+            # Suggestions come from the autocomplete endpoint instead
+            'autocomplete': 'off',
+            'list': 'book-suggestions',
         })
     )
     
-    category = forms.ModelChoiceField(
-        queryset=Category.objects.all(),
-        required=False,
-        empty_label="All Categories",
-        widget=forms.Select(attrs={'class': 'form-control'})
-    )
+    # Category, language, condition, etc. are facets, see admin_app.facets
     
     min_price = forms.DecimalField(
         required=False,
@@ -0,0 +1,73 @@
+"""Cover image renditions.
+
+Each uploaded cover is cropped to a few fixed sizes (matching the boxes the
+templates draw, at 2x for high-density screens) and saved as JPEG and WebP
+next to the original under ``<upload dir>/renditions/``. Rendition paths are
+derived from the original's name, so templates can link them without extra
+database fields.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# name -> (width, height) in pixels
+RENDITIONS = {
+    'mini': (60, 80),
+    'small': (240, 360),
+    'medium': (400, 560),
+}
+
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+
+def rendition_name(original_name, size, fmt):
+    directory, filename = os.path.split(original_name)
+    stem = os.path.splitext(filename)[0]
+    extension = FORMATS[fmt][0]
+    return os.path.join(directory, 'renditions', f'{stem}_{size}.{extension}')
+
+
+def rendition_urls(original_name, storage=default_storage):
+    """{size: {'jpeg': url, 'webp': url}} for every rendition of ``original_name``"""
+    return {
+        size: {fmt: storage.url(rendition_name(original_name, size, fmt)) for fmt in FORMATS}
+        for size in RENDITIONS
+    }
+
+
+def generate_renditions(original_name, storage=default_storage, source=None):
+    """Create every rendition of ``original_name``; returns the stored names.
+
+    ``source`` may be an already open file to avoid reading the original back
+    from storage.
+    """
+    if source is None:
+        with storage.open(original_name, 'rb') as handle:
+            image = Image.open(handle)
+            image.load()
+    else:
+        source.seek(0)
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    saved = []
+    for size, box in RENDITIONS.items():
+        # Crop to fill the box, like the templates' object-fit: cover
+        fitted = ImageOps.fit(image, box, method=Image.Resampling.LANCZOS)
+        for fmt, (_, save_options) in FORMATS.items():
+            buffer = BytesIO()
+            fitted.save(buffer, format=fmt.upper(), **save_options)
+            name = rendition_name(original_name, size, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            saved.append(storage.save(name, ContentFile(buffer.getvalue())))
+    return saved
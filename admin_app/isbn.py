@@ -0,0 +1,44 @@
+"""ISBN normalisation helpers.
+
+Books store their ISBN as a bare 13-digit string so that both the unique index
+and exact lookups work regardless of how the number was typed or scanned.
+"""
+import re
+
+from django.core.exceptions import ValidationError
+
+SEPARATORS_RE = re.compile(r'[\s\-]')
+ISBN10_RE = re.compile(r'^\d{9}[\dX]$')
+ISBN13_RE = re.compile(r'^97[89]\d{10}$')
+
+
+def _isbn10_is_valid(digits):
+    total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(digits))
+    return total % 11 == 0
+
+
+def _isbn13_check_digit(first12):
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(value):
+    """Return ``value`` as a bare ISBN-13, or None if it is not a valid ISBN-10/13"""
+    if not value:
+        return None
+    digits = SEPARATORS_RE.sub('', str(value)).upper()
+    if ISBN10_RE.match(digits):
+        if not _isbn10_is_valid(digits):
+            return None
+        first12 = '978' + digits[:9]
+        return first12 + _isbn13_check_digit(first12)
+    if ISBN13_RE.match(digits):
+        if _isbn13_check_digit(digits[:12]) != digits[12]:
+            return None
+        return digits
+    return None
+
+
+def validate_isbn(value):
+    if value and normalize_isbn(value) is None:
+        raise ValidationError('Enter a valid ISBN-10 or ISBN-13.', code='invalid_isbn')
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from admin_app.recommendations import TOP_K, rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute related books and per-user recommendations from reviews, wishlists, carts and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Neighbours and recommendations kept per book/user')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        books, users = rebuild_recommendations(top_k=options['top_k'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored neighbours for {books} books and recommendations for {users} users '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from admin_app.remote_covers import refresh_covers
+
+
+class Command(BaseCommand):
+    help = 'Download remote cover_image_url images into local storage and revalidate cached copies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revalidate-after', type=float, default=24, help='Hours before a cached cover is rechecked')
+        parser.add_argument('--limit', type=int, help='Process at most this many books')
+        parser.add_argument('--timeout', type=float, default=10)
+
+    def handle(self, *args, **options):
+        results = refresh_covers(
+            timedelta(hours=options['revalidate_after']), limit=options['limit'], timeout=options['timeout'],
+        )
+        summary = ', '.join(f'{count} {result}' for result, count in sorted(results.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Remote covers: {summary}'))
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from admin_app.export import FORMATS, iter_export
+
+
+class Command(BaseCommand):
+    help = 'Stream the book catalogue to a CSV or JSONL file with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', default='-', help="Output path, or '-' for stdout")
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunks = iter_export(options['format'], compress=options['gzip'], chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            return
+        written = 0
+        with open(options['output'], 'wb') as out:
+            for chunk in chunks:
+                written += out.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {written} bytes to {options["output"]}'))
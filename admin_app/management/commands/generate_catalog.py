@@ -0,0 +1,189 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.signals import post_delete
+
+from admin_app import autocomplete, signals
+from admin_app.caching import bump_catalog_version
+from admin_app.models import Book, Cart, CartItem, Category, Review, Wishlist, reconcile_ratings
+from admin_app.search import get_backend
+
+USERNAME_PREFIX = 'bench_user_'
+CATEGORY_PREFIX = 'Synthetic '
+PASSWORD = 'benchmark'
+
+ADJECTIVES = [
+    'Silent', 'Hidden', 'Golden', 'Broken', 'Distant', 'Burning', 'Forgotten', 'Crimson', 'Endless', 'Quiet',
+    'Wild', 'Frozen', 'Secret', 'Last', 'Lost', 'Bright', 'Dark', 'Hollow', 'Ancient', 'Restless',
+]
+NOUNS = [
+    'River', 'Garden', 'Empire', 'Harbor', 'Mountain', 'Letter', 'Kingdom', 'Orchard', 'Signal', 'Winter',
+    'Forest', 'Island', 'Mirror', 'Lantern', 'Voyage', 'Library', 'Station', 'Summer', 'Compass', 'Tide',
+]
+FIRST_NAMES = ['Ada', 'Ben', 'Clara', 'David', 'Elena', 'Farid', 'Grace', 'Hugo', 'Iris', 'Jonas', 'Kenji', 'Lena']
+LAST_NAMES = ['Adams', 'Brook', 'Castillo', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jensen']
+GENRES = ['Fiction', 'Mystery', 'Science', 'History', 'Poetry', 'Travel', 'Fantasy', 'Biography', 'Cooking', 'Art']
+LANGUAGES = ['English'] * 8 + ['French', 'German', 'Spanish', 'Italian']
+PUBLISHERS = ['Northwind Press', 'Harbor House', 'Bluebird Books', 'Meridian', 'Atlas & Co', 'Paper Lantern']
+CONDITIONS = [value for value, label in Book.CONDITION_CHOICES]
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a deterministic synthetic catalogue (categories, books, users, reviews, wishlists '
+        'and carts) with bulk inserts, for benchmarking'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--users', type=int, help='Defaults to one user per 20 books')
+        parser.add_argument('--reviews-per-user', type=int, default=5)
+        parser.add_argument('--wishlist-size', type=int, default=10)
+        parser.add_argument('--cart-size', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated data first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        users = options['users'] if options['users'] is not None else max(options['books'] // 20, 1)
+        if options['books'] < 1 or options['categories'] < 1:
+            raise CommandError('--books and --categories must be at least 1')
+        per_user = max(options['reviews_per_user'], options['wishlist_size'], options['cart_size'])
+        if per_user > options['books']:
+            raise CommandError('Per-user review, wishlist and cart sizes cannot exceed --books')
+
+        started = time.monotonic()
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Synthetic data already exists; pass --clear to replace it')
+        with transaction.atomic():
+            category_ids = self.create_categories(options['categories'])
+            book_ids = self.create_books(options['books'], category_ids)
+            user_ids = self.create_users(users)
+            self.create_reviews(user_ids, book_ids, options['reviews_per_user'])
+            self.create_wishlists(user_ids, book_ids, options['wishlist_size'])
+            self.create_carts(user_ids, book_ids, options['cart_size'])
+            reconcile_ratings(
+                Book.objects.filter(category__category_name__startswith=CATEGORY_PREFIX), Review.objects.all()
+            )
+
+        self.stdout.write('Rebuilding the search index and autocomplete snapshot')
+        get_backend().rebuild(Book.objects.all(), batch_size=self.batch_size)
+        autocomplete.rebuild()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(category_ids)} categories, {len(book_ids)} books and {len(user_ids)} users '
+            f'in {time.monotonic() - started:.1f}s (user password: "{PASSWORD}")'
+        ))
+
+    def clear(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        books = Book.objects.filter(category__category_name__startswith=CATEGORY_PREFIX)
+        self.stdout.write('Deleting previously generated data')
+        with transaction.atomic():
+            # Generated users' orders go with them; books other customers
+            # ordered are protected by their order items, so hide those
+            users.delete()
+            books.filter(orderitem__isnull=False).update(is_available=False)
+            # Without the per-book receivers this is a few bulk DELETEs instead
+            # of a search, autocomplete and cache task per book; handle()
+            # rebuilds both indexes and bumps the catalogue version once
+            receivers = [signals.book_deleted, signals.invalidate_catalog]
+            for receiver in receivers:
+                post_delete.disconnect(receiver, sender=Book)
+            try:
+                books.filter(orderitem__isnull=True).delete()
+            finally:
+                for receiver in receivers:
+                    post_delete.connect(receiver, sender=Book)
+            Category.objects.filter(category_name__startswith=CATEGORY_PREFIX).delete()
+
+    def bulk_create(self, model, objects):
+        """bulk_create an iterable in batches; returns the new primary keys"""
+        ids = []
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                ids += [created.pk for created in model.objects.bulk_create(batch)]
+                batch = []
+        if batch:
+            ids += [created.pk for created in model.objects.bulk_create(batch)]
+        self.stdout.write(f'{model.__name__}: {len(ids)}')
+        return ids
+
+    def create_categories(self, count):
+        return self.bulk_create(Category, (
+            Category(
+                category_name=f'{CATEGORY_PREFIX}{GENRES[index % len(GENRES)]} {index // len(GENRES) + 1}',
+                cat_description='Generated for benchmarking',
+            )
+            for index in range(count)
+        ))
+
+    def create_books(self, count, category_ids):
+        rng = self.rng
+        return self.bulk_create(Book, (
+            Book(
+                title=f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {index + 1}',
+                author=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                category_id=rng.choice(category_ids),
+                price=Decimal(rng.randint(300, 8000)) / 100,
+                description=' '.join(rng.choices(ADJECTIVES + NOUNS, k=30)).lower(),
+                publisher=rng.choice(PUBLISHERS),
+                pages=rng.randint(80, 900),
+                language=rng.choice(LANGUAGES),
+                condition=rng.choice(CONDITIONS),
+                stock_quantity=rng.randint(0, 50),
+                is_featured=rng.random() < 0.01,
+            )
+            for index in range(count)
+        ))
+
+    def create_users(self, count):
+        # Hashing once keeps this fast; every generated user shares the password
+        password = make_password(PASSWORD)
+        return self.bulk_create(User, (
+            User(username=f'{USERNAME_PREFIX}{index + 1}', email=f'{USERNAME_PREFIX}{index + 1}@example.com', password=password)
+            for index in range(count)
+        ))
+
+    def create_reviews(self, user_ids, book_ids, per_user):
+        rng = self.rng
+        self.bulk_create(Review, (
+            Review(
+                user_id=user_id,
+                book_id=book_id,
+                rating=rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 4, 6, 5])[0],
+                title='Generated review',
+                comment='Generated for benchmarking.',
+                rating_applied=True,
+            )
+            for user_id in user_ids
+            for book_id in rng.sample(book_ids, per_user)
+        ))
+
+    def create_wishlists(self, user_ids, book_ids, per_user):
+        wishlist_ids = self.bulk_create(Wishlist, (Wishlist(user_id=user_id) for user_id in user_ids))
+        self.bulk_create(Wishlist.books.through, (
+            Wishlist.books.through(wishlist_id=wishlist_id, book_id=book_id)
+            for wishlist_id in wishlist_ids
+            for book_id in self.rng.sample(book_ids, per_user)
+        ))
+
+    def create_carts(self, user_ids, book_ids, per_user):
+        cart_ids = self.bulk_create(Cart, (Cart(user_id=user_id) for user_id in user_ids))
+        self.bulk_create(CartItem, (
+            CartItem(cart_id=cart_id, book_id=book_id, quantity=self.rng.randint(1, 3))
+            for cart_id in cart_ids
+            for book_id in self.rng.sample(book_ids, per_user)
+        ))
@@ -0,0 +1,31 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from admin_app.images import FORMATS, RENDITIONS, generate_renditions, rendition_name
+from admin_app.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Generate resized JPEG/WebP renditions for uploaded book covers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing-only', action='store_true', help='Skip covers whose renditions already exist')
+
+    def handle(self, *args, **options):
+        names = (
+            Book.objects.exclude(cover_image='').exclude(cover_image=None)
+            .values_list('cover_image', flat=True).iterator()
+        )
+        generated = failed = 0
+        for name in names:
+            if options['missing_only'] and all(
+                default_storage.exists(rendition_name(name, size, fmt)) for size in RENDITIONS for fmt in FORMATS
+            ):
+                continue
+            try:
+                generate_renditions(name)
+                generated += 1
+            except OSError as exc:
+                failed += 1
+                self.stderr.write(f'{name}: {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {generated} covers ({failed} failed)'))
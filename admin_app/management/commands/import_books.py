@@ -0,0 +1,173 @@
+import csv
+import gzip
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from admin_app import autocomplete
+from admin_app.caching import bump_catalog_version
+from admin_app.forms import BookForm
+from admin_app.models import Book, Category
+from admin_app.search import get_backend
+
+FALSE_STRINGS = {'', '0', 'false', 'no', 'n', 'off'}
+
+
+class BookImportForm(BookForm):
+    """BookForm rules without per-row queries: categories are resolved from an
+    in-memory map and ISBN uniqueness is handled by the upsert itself."""
+
+    class Meta(BookForm.Meta):
+        fields = [f for f in BookForm.Meta.fields if f != 'category']
+
+    def validate_unique(self):
+        pass
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream books from a CSV or JSONL file and upsert them by ISBN in batches. Existing books only '
+        'have the columns present in their row updated; rows without an ISBN are rejected'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file (optionally .gz), or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-categories', action='store_true', help='Create categories that do not exist yet')
+        parser.add_argument('--dry-run', action='store_true', help='Validate rows without writing anything')
+        parser.add_argument('--max-errors', type=int, default=20, help='Number of rejected rows to print')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.removesuffix('.gz').endswith('.csv') else 'jsonl')
+        self.batch_size = options['batch_size']
+        self.create_categories = options['create_categories']
+        self.dry_run = options['dry_run']
+        self.max_errors = options['max_errors']
+        self.categories = {name.lower(): pk for name, pk in Category.objects.values_list('category_name', 'id')}
+        self.search_backend = get_backend()
+        self.defaults = {
+            name: Book._meta.get_field(name).get_default()
+            for name in BookImportForm.Meta.fields if Book._meta.get_field(name).has_default()
+        }
+        self.imported = self.rejected = 0
+
+        started = time.monotonic()
+        try:
+            with open_input(path) as stream:
+                batch = []
+                for line_no, row in enumerate(read_rows(stream, fmt), start=1):
+                    entry = self.build_book(line_no, row)
+                    if entry is not None:
+                        batch.append(entry)
+                    if len(batch) >= self.batch_size:
+                        self.write_batch(batch)
+                        batch = []
+                        self.report(started)
+                self.write_batch(batch)
+        except (OSError, csv.Error, json.JSONDecodeError) as exc:
+            raise CommandError(f'Could not read {path}: {exc}')
+
+        if self.imported and not self.dry_run:
+            bump_catalog_version()
+            autocomplete.rebuild()
+        elapsed = time.monotonic() - started
+        verb = 'Validated' if self.dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {self.imported} books, rejected {self.rejected} rows in {elapsed:.1f}s '
+            f'({self.imported / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+
+    def report(self, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{self.imported} rows ({self.imported / elapsed if elapsed else 0:.0f} rows/s)')
+
+    def reject(self, line_no, reason):
+        self.rejected += 1
+        if self.rejected <= self.max_errors:
+            self.stderr.write(f'Row {line_no}: {reason}')
+
+    def resolve_category(self, name):
+        name = (name or '').strip()
+        if not name:
+            return None
+        category_id = self.categories.get(name.lower())
+        if category_id is None and self.create_categories and not self.dry_run:
+            category_id = Category.objects.create(category_name=name, cat_description='').id
+            self.categories[name.lower()] = category_id
+        return category_id
+
+    def build_book(self, line_no, row):
+        """A validated, unsaved Book with the set of fields the row supplied"""
+        provided = {key: value for key, value in row.items() if key and value not in (None, '')}
+        if not provided.get('isbn'):
+            # Nothing to upsert on: re-running the feed would duplicate the row
+            self.reject(line_no, 'isbn: required to match existing books')
+            return None
+        # Defaults only fill in new books; existing ones keep unmentioned columns
+        data = {**self.defaults, **provided}
+        if isinstance(data.get('is_featured'), str):
+            data['is_featured'] = data['is_featured'].strip().lower() not in FALSE_STRINGS
+        form = BookImportForm(data)
+        if not form.is_valid():
+            errors = '; '.join(f'{field}: {" ".join(msgs)}' for field, msgs in form.errors.items())
+            self.reject(line_no, errors)
+            return None
+
+        category_name = data.get('category')
+        category_id = self.resolve_category(category_name)
+        if category_name and category_id is None and not (self.dry_run and self.create_categories):
+            self.reject(line_no, f'unknown category "{category_name}"')
+            return None
+
+        book = form.save(commit=False)
+        book.category_id = category_id
+        fields = {name for name in provided if name in BookImportForm.Meta.fields or name == 'category'}
+        return book, frozenset(fields - {'isbn'})
+
+    def write_batch(self, books):
+        if not books:
+            return
+        # One row per ISBN, or the upsert would touch the same row twice
+        by_isbn = {book.isbn: (book, fields) for book, fields in books}
+        self.imported += len(by_isbn)
+        if self.dry_run:
+            return
+
+        # Rows naming different columns need different update_fields
+        groups = {}
+        for book, fields in by_isbn.values():
+            groups.setdefault(fields, []).append(book)
+        with transaction.atomic():
+            for fields, group in groups.items():
+                Book.objects.bulk_create(
+                    group,
+                    update_conflicts=True,
+                    unique_fields=['isbn'],
+                    update_fields=sorted(fields) + ['updated_at'],
+                )
+            # bulk_create skips the post_save signal, so index the batch here
+            self.search_backend.index_books(list(
+                Book.objects.filter(isbn__in=list(by_isbn)).only('id', 'title', 'author', 'isbn', 'description')
+            ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from admin_app.models import Book
+from admin_app.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_backend(using)
+        with transaction.atomic(using=using):
+            with backend.connection.cursor() as cursor:
+                backend.create_index(cursor)
+            total = backend.rebuild(Book.objects.using(using), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} books with {type(backend).__name__}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from admin_app.models import Book, Review, reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored book rating aggregates that drifted from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many books drifted')
+
+    def handle(self, *args, **options):
+        count = reconcile_ratings(
+            # Reviews still waiting for apply_review_rating would be counted twice
+            Book.objects.all(), Review.objects.filter(rating_applied=True), dry_run=options['dry_run']
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{count} books have drifted rating aggregates')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Reconciled ratings for {count} books'))
@@ -0,0 +1,138 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from admin_app.models import Book
+
+from .generate_catalog import USERNAME_PREFIX
+
+# Under the generated prefix so generate_catalog --clear removes it too
+BENCH_ADMIN = f'{USERNAME_PREFIX}admin'
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the storefront and admin views through the test client against the current database, '
+        'report latency percentiles and query counts, and compare them with a baseline file'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Run only these scenarios')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--baseline', help='JSON file from --save-baseline to compare against')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write these results as a baseline file')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed p95 slowdown against the baseline as a fraction (default 0.25)',
+        )
+
+    def handle(self, *args, **options):
+        book = Book.objects.filter(is_available=True).order_by('-total_reviews', 'id').first()
+        user = User.objects.filter(username__startswith=USERNAME_PREFIX).exclude(username=BENCH_ADMIN).order_by('id').first()
+        if book is None or user is None:
+            raise CommandError('No data to benchmark; run generate_catalog first')
+        admin, _ = User.objects.get_or_create(
+            username=BENCH_ADMIN, defaults={'is_staff': True, 'is_superuser': True},
+        )
+
+        scenarios = {
+            'home': (None, reverse('home')),
+            'book_catalog': (None, reverse('book_catalog')),
+            'book_catalog_search': (None, reverse('book_catalog') + '?query=garden&sort_by=price'),
+            # No sort_by: the default relevance ordering
+            'book_catalog_search_ranked': (None, reverse('book_catalog') + '?query=garden'),
+            'book_catalog_facets': (None, reverse('book_catalog') + '?language=English&price=10-25'),
+            'book_detail': (None, reverse('book_detail', args=[book.id])),
+            'dashboard': (user, reverse('dashboard')),
+            'admin_dashboard': (admin, reverse('admin_dashboard')),
+        }
+        if options['only']:
+            unknown = set(options['only']) - set(scenarios)
+            if unknown:
+                raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+            scenarios = {name: scenarios[name] for name in options['only']}
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, (login_as, url) in scenarios.items():
+                results[name] = self.run_scenario(login_as, url, options)
+                self.report(name, results[name])
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as handle:
+                json.dump(results, handle, indent=2, sort_keys=True)
+            self.stdout.write(f'Baseline written to {options["save_baseline"]}')
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def run_scenario(self, login_as, url, options):
+        client = Client()
+        if login_as is not None:
+            client.force_login(login_as)
+        for _ in range(options['warmup']):
+            client.get(url)
+
+        timings = []
+        query_counts = []
+        for _ in range(options['iterations']):
+            if options['cold_cache']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+            query_counts.append(len(queries))
+        return {
+            'url': url,
+            'p50_ms': round(percentile(timings, 0.50), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': max(query_counts),
+            'median_queries': statistics.median(query_counts),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<26} p50 {result["p50_ms"]:>8.2f}ms  p95 {result["p95_ms"]:>8.2f}ms  '
+            f'p99 {result["p99_ms"]:>8.2f}ms  queries {result["queries"]:>3}'
+        )
+
+    def compare(self, results, path, tolerance):
+        try:
+            with open(path) as handle:
+                baseline = json.load(handle)
+        except (OSError, json.JSONDecodeError) as exc:
+            raise CommandError(f'Could not read baseline {path}: {exc}')
+
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                regressions.append(f'{name}: {result["queries"]} queries (baseline {expected["queries"]})')
+            if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: p95 {result["p95_ms"]}ms (baseline {expected["p95_ms"]}ms)')
+        if regressions:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
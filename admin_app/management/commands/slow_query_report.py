@@ -0,0 +1,81 @@
+import glob
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from admin_app.slow_queries import normalize
+
+SORT_KEYS = {
+    'total': lambda group: group['total_ms'],
+    'count': lambda group: group['count'],
+    'max': lambda group: group['max_ms'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Summarise the slow-query log by normalised query fingerprint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files', nargs='*',
+            help='JSONL files to read; defaults to SLOW_QUERY_LOG_FILE and its rotated backups',
+        )
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--view', help='Only queries issued by this view name')
+
+    def handle(self, *args, **options):
+        files = options['files'] or sorted(glob.glob(f'{glob.escape(settings.SLOW_QUERY_LOG_FILE)}*'))
+        if not files:
+            raise CommandError(f'No slow-query log at {settings.SLOW_QUERY_LOG_FILE}')
+
+        groups = {}
+        skipped = 0
+        for path in files:
+            try:
+                handle = open(path)
+            except OSError as exc:
+                raise CommandError(f'Could not read {path}: {exc}')
+            with handle:
+                for line in handle:
+                    try:
+                        entry = json.loads(line)
+                        key, duration = entry['fingerprint'], entry['duration_ms']
+                    except (ValueError, KeyError, TypeError):
+                        skipped += 1
+                        continue
+                    if options['view'] and entry.get('view') != options['view']:
+                        continue
+                    group = groups.setdefault(key, {
+                        'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'views': Counter(),
+                        'sql': normalize(entry.get('sql', '')), 'stack': [], 'plan': None,
+                    })
+                    group['count'] += 1
+                    group['total_ms'] += duration
+                    group['views'][entry.get('view') or '-'] += 1
+                    if duration >= group['max_ms']:
+                        group['max_ms'] = duration
+                        group['stack'] = entry.get('stack') or []
+                    if entry.get('plan'):
+                        group['plan'] = entry['plan']
+
+        ranked = sorted(groups.items(), key=lambda item: SORT_KEYS[options['sort']](item[1]), reverse=True)
+        for key, group in ranked[:options['limit']]:
+            views = ', '.join(f'{view} ({count})' for view, count in group['views'].most_common(3))
+            self.stdout.write(self.style.SUCCESS(
+                f'{key}  {group["count"]} queries, total {group["total_ms"]:.1f}ms, '
+                f'avg {group["total_ms"] / group["count"]:.1f}ms, max {group["max_ms"]:.1f}ms'
+            ))
+            self.stdout.write(f'  views: {views}')
+            self.stdout.write(f'  sql:   {group["sql"][:500]}')
+            if group['stack']:
+                self.stdout.write(f'  from:  {group["stack"][-1]}')
+            for line in group['plan'] or []:
+                self.stdout.write(f'  plan:  {line}')
+            self.stdout.write('')
+        summary = f'{len(groups)} fingerprints from {len(files)} file(s)'
+        if skipped:
+            summary += f', {skipped} malformed lines skipped'
+        self.stdout.write(summary)
@@ -0,0 +1,183 @@
+"""Per-request performance instrumentation.
+
+``PerformanceMiddleware`` measures each request's wall time, SQL query count
+and time (through ``connection.execute_wrapper``), template render time and
+response size. It reports them in a ``Server-Timing`` header, visible in the
+browser's network panel, and adds them to per-view histograms. The admin-only
+``metrics`` view exposes those in the Prometheus text format. It also hooks
+up the slow-query log (see ``admin_app.slow_queries``).
+
+The histograms live in process memory, like the default prometheus_client
+registry: with several workers, each scrape sees the worker that served it.
+"""
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+from . import slow_queries
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    # name: (help text, buckets)
+    'http_request_duration_seconds': ('Wall time spent handling the request', DURATION_BUCKETS),
+    'http_request_db_queries': ('SQL queries executed per request', QUERY_BUCKETS),
+    'http_request_db_duration_seconds': ('Time spent in SQL queries per request', DURATION_BUCKETS),
+    'http_request_template_duration_seconds': ('Time spent rendering templates per request', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Size of non-streaming response bodies', SIZE_BUCKETS),
+}
+
+
+class RequestStats:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+_current_stats = ContextVar('request_stats', default=None)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.responses = {}
+
+    def observe(self, labels, status, values):
+        """``values`` maps histogram names to this request's measurement"""
+        with self.lock:
+            key = (labels['view'], labels['method'], str(status))
+            self.responses[key] = self.responses.get(key, 0) + 1
+            for name, value in values.items():
+                series = self.histograms.setdefault(name, {})
+                histogram = series.get((labels['view'], labels['method']))
+                if histogram is None:
+                    histogram = series[(labels['view'], labels['method'])] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            lines += [
+                '# HELP http_responses_total Responses by view, method and status',
+                '# TYPE http_responses_total counter',
+            ]
+            for (view, method, status), count in sorted(self.responses.items()):
+                lines.append(f'http_responses_total{{view="{_escape(view)}",method="{method}",status="{status}"}} {count}')
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (view, method), histogram in sorted(self.histograms.get(name, {}).items()):
+                    labels = f'view="{_escape(view)}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+registry = Registry()
+
+
+def _instrument_templates():
+    """Time top-level template renders; includes are part of their parent"""
+    if getattr(DjangoTemplate.render, 'instrumented', False):
+        return
+    original = DjangoTemplate.render
+
+    def render(self, context=None, request=None):
+        stats = _current_stats.get()
+        if stats is None:
+            return original(self, context, request)
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+    render.instrumented = True
+    DjangoTemplate.render = render
+
+
+class PerformanceMiddleware:
+    """Server-Timing header and Prometheus histograms for every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _instrument_templates()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        slow_query_logger = slow_queries.for_request(request)
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                    if slow_query_logger is not None:
+                        stack.enter_context(connection.execute_wrapper(slow_query_logger))
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        labels = {'view': match.view_name if match else 'unmatched', 'method': request.method}
+        values = {
+            'http_request_duration_seconds': duration,
+            'http_request_db_queries': stats.queries,
+            'http_request_db_duration_seconds': stats.db_time,
+            'http_request_template_duration_seconds': stats.template_time,
+        }
+        if not response.streaming:
+            values['http_response_size_bytes'] = len(response.content)
+        registry.observe(labels, response.status_code, values)
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={duration * 1000:.1f}',
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'tpl;dur={stats.template_time * 1000:.1f}',
+        ])
+        return response
@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# The index as it was first created, inlined so later changes to
+# admin_app.search never alter what this migration does
+SQLITE_TABLE = 'admin_app_book_fts'
+POSTGRES_TABLE = 'admin_app_book_search'
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(isbn, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'D')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    book_table = apps.get_model('admin_app', 'Book')._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5('
+            "title, author, isbn, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {SQLITE_TABLE} (rowid, title, author, isbn, description) '
+            f"SELECT id, title, author, coalesce(isbn, ''), description FROM {book_table}"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ('
+            f'book_id bigint PRIMARY KEY REFERENCES {book_table} (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_idx '
+            f'ON {POSTGRES_TABLE} USING GIN (document)'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {POSTGRES_TABLE} (book_id, document) SELECT id, {POSTGRES_DOCUMENT} FROM {book_table}'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {POSTGRES_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0003_alter_book_options_alter_category_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:43
+
+import re
+
+import admin_app.isbn
+from django.db import migrations, models
+
+
+def normalize_isbn(value):
+    """admin_app.isbn.normalize_isbn as of this migration, so later changes to it never alter it"""
+    digits = re.sub(r'[\s\-]', '', value).upper()
+    if re.match(r'^\d{9}[\dX]$', digits):
+        if sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(digits)) % 11:
+            return None
+        first12 = '978' + digits[:9]
+    elif re.match(r'^97[89]\d{10}$', digits):
+        first12 = digits[:12]
+    else:
+        return None
+    check = str((10 - sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(first12)) % 10) % 10)
+    if len(digits) == 13 and digits[12] != check:
+        return None
+    return first12 + check
+
+
+def normalize_existing_isbns(apps, schema_editor):
+    Book = apps.get_model('admin_app', 'Book')
+    db = schema_editor.connection.alias
+    Book.objects.using(db).filter(isbn='').update(isbn=None)
+    taken = set(Book.objects.using(db).exclude(isbn=None).values_list('isbn', flat=True))
+    for book_id, isbn in Book.objects.using(db).exclude(isbn=None).values_list('id', 'isbn'):
+        normalized = normalize_isbn(isbn)
+        # Leave the row alone if it is invalid or would collide with another book
+        if normalized is None or normalized == isbn or normalized in taken:
+            continue
+        Book.objects.using(db).filter(id=book_id).update(isbn=normalized)
+        taken.discard(isbn)
+        taken.add(normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0004_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(blank=True, help_text='ISBN-10 or ISBN-13, stored as 13 digits', max_length=13, null=True, unique=True, validators=[admin_app.isbn.validate_isbn]),
+        ),
+        migrations.RunPython(normalize_existing_isbns, migrations.RunPython.noop),
+    ]
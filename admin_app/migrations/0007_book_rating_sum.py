@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:48
+
+from django.db import migrations, models
+from django.db.models import Case, Count, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+
+
+def populate_rating_sum(apps, schema_editor):
+    # Inlined rather than calling admin_app.models.reconcile_ratings, so later
+    # changes to it never alter what this migration does
+    db = schema_editor.connection.alias
+    Book = apps.get_model('admin_app', 'Book')
+    Review = apps.get_model('admin_app', 'Review')
+    totals = (
+        Review.objects.using(db).filter(book=OuterRef('pk')).order_by().values('book')
+        .annotate(rating_total=Sum('rating'), review_count=Count('id'))
+    )
+    rating_sum = Coalesce(Subquery(totals.values('rating_total')), 0)
+    review_count = Coalesce(Subquery(totals.values('review_count')), 0)
+    Book.objects.using(db).update(
+        rating_sum=rating_sum,
+        total_reviews=review_count,
+        average_rating=Case(
+            When(GreaterThan(review_count, 0), then=Round(Cast(rating_sum, models.FloatField()) / review_count, 2)),
+            default=Value(0.0),
+            output_field=models.DecimalField(max_digits=3, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0006_book_storefront_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, help_text='Sum of all review ratings, kept in step with total_reviews'),
+        ),
+        migrations.RunPython(populate_rating_sum, migrations.RunPython.noop),
+    ]
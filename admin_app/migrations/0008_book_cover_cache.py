@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0007_book_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_cache',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='book_covers/cache/'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_cache_checked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_cache_etag',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_cache_last_modified',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_cache_url',
+            field=models.URLField(blank=True, editable=False, help_text='URL the cached cover was fetched from', max_length=500),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+def mark_existing_reviews_applied(apps, schema_editor):
+    # Ratings written before this migration were already added to their books
+    Review = apps.get_model('admin_app', 'Review')
+    Review.objects.using(schema_editor.connection.alias).update(rating_applied=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0008_book_cover_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='rating_applied',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_existing_reviews_applied, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:28
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_checked_url(apps, schema_editor):
+    # save() cleared checked_at whenever the URL changed, so a book that has
+    # been checked was last attempted with its current URL
+    Book = apps.get_model('admin_app', 'Book')
+    Book.objects.using(schema_editor.connection.alias).exclude(cover_cache_checked_at=None).update(
+        cover_cache_checked_url=Coalesce(F('cover_image_url'), Value(''))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0012_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_cache_checked_url',
+            field=models.URLField(blank=True, editable=False, help_text='URL last fetched or attempted, whether or not it succeeded', max_length=500),
+        ),
+        migrations.RunPython(backfill_checked_url, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,54 @@
+import logging
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Case, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
 from django import forms
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .images import generate_renditions, rendition_urls
+from .isbn import normalize_isbn, validate_isbn
+
+logger = logging.getLogger(__name__)
 
 # Create your models here.
 
+def average_rating_expression(rating_sum, review_count):
+    """SQL expression for the rounded average rating, 0 when there are no reviews"""
+    return Case(
+        When(GreaterThan(review_count, 0), then=Round(Cast(rating_sum, models.FloatField()) / review_count, 2)),
+        default=Value(0.0),
+        output_field=models.DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def reconcile_ratings(books, reviews, dry_run=False):
+    """Recompute rating aggregates for books in ``books`` whose stored values drifted.
+
+    Works on querysets so migrations can pass historical models. Returns the
+    number of books that were (or, with ``dry_run``, would be) corrected.
+    """
+    totals = (
+        reviews.filter(book=OuterRef('pk')).order_by().values('book')
+        .annotate(rating_total=Sum('rating'), review_count=Count('id'))
+    )
+    actual_sum = Coalesce(Subquery(totals.values('rating_total')), 0)
+    actual_count = Coalesce(Subquery(totals.values('review_count')), 0)
+    drifted = books.annotate(actual_sum=actual_sum, actual_count=actual_count).exclude(
+        rating_sum=F('actual_sum'), total_reviews=F('actual_count')
+    )
+    if dry_run:
+        return drifted.count()
+    return books.filter(pk__in=drifted.values('pk')).update(
+        rating_sum=actual_sum,
+        total_reviews=actual_count,
+        average_rating=average_rating_expression(actual_sum, actual_count),
+    )
+
+
 class Category(models.Model):
     category_name = models.CharField(max_length=200)
     cat_description = models.TextField()
@@ -18,6 +62,9 @@ class Category(models.Model):
         return self.category_name
 
     def book_count(self):
+        # Views that list categories annotate num_books to avoid a query per row
+        if hasattr(self, 'num_books'):
+            return self.num_books
         return self.book_set.count()
 
 
@@ -31,13 +78,20 @@ class Book(models.Model):
     
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=100)
-    isbn = models.CharField(max_length=13, unique=True, blank=True, null=True, help_text="13-digit ISBN number")
+    isbn = models.CharField(max_length=13, unique=True, blank=True, null=True, validators=[validate_isbn], help_text="ISBN-10 or ISBN-13, stored as 13 digits")
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     original_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, help_text="Original price for discount calculation")
     description = models.TextField()
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True, help_text="Upload book cover image")
     cover_image_url = models.URLField(max_length=500, blank=True, null=True, help_text="Or provide URL to book cover image")
+    # Local copy of cover_image_url, maintained by admin_app.remote_covers
+    cover_cache = models.ImageField(upload_to='book_covers/cache/', blank=True, null=True, editable=False)
+    cover_cache_url = models.URLField(max_length=500, blank=True, editable=False, help_text="URL the cached cover was fetched from")
+    cover_cache_etag = models.CharField(max_length=200, blank=True, editable=False)
+    cover_cache_last_modified = models.CharField(max_length=64, blank=True, editable=False)
+    cover_cache_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
+    cover_cache_checked_url = models.URLField(max_length=500, blank=True, editable=False, help_text="URL last fetched or attempted, whether or not it succeeded")
     publisher = models.CharField(max_length=200, blank=True)
     publication_date = models.DateField(null=True, blank=True)
     pages = models.PositiveIntegerField(null=True, blank=True)
@@ -48,23 +102,69 @@ class Book(models.Model):
     is_available = models.BooleanField(default=True)
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0, help_text="Sum of all review ratings, kept in step with total_reviews")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        # Storefront queries always filter on the availability flags and order
+        # by one sort key (plus the id tiebreaker used by keyset pagination).
+        # Partial indexes on those flags let ordered LIMIT queries walk the
+        # index instead of scanning and sorting the table.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], condition=Q(is_available=True), name='book_avail_created_idx'),
+            models.Index(fields=['title', 'id'], condition=Q(is_available=True), name='book_avail_title_idx'),
+            models.Index(fields=['price', 'id'], condition=Q(is_available=True), name='book_avail_price_idx'),
+            models.Index(fields=['average_rating', 'id'], condition=Q(is_available=True), name='book_avail_rating_idx'),
+            models.Index(fields=['category', 'created_at'], condition=Q(is_available=True), name='book_avail_cat_created_idx'),
+            models.Index(fields=['created_at'], condition=Q(is_featured=True), name='book_featured_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='book_created_idx'),
+            # Max(updated_at) for the API's Last-Modified header
+            models.Index(fields=['updated_at'], name='book_updated_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        # Store ISBNs as bare ISBN-13 so the unique index serves exact lookups
+        self.isbn = normalize_isbn(self.isbn) or self.isbn or None
+        new_cover = bool(self.cover_image) and not self.cover_image._committed
+        if (self.cover_image_url or '') != self.cover_cache_checked_url:
+            # Make the cover cache fetch the new URL on its next run. Comparing
+            # with the last attempted URL rather than the cached one means a
+            # URL that failed is not retried on every edit
+            self.cover_cache_checked_at = None
+        super().save(*args, **kwargs)
+        if new_cover:
+            try:
+                generate_renditions(self.cover_image.name, storage=self.cover_image.storage)
+            except OSError:
+                logger.exception('Could not generate cover renditions for book %s', self.pk)
+    
+    def has_cached_cover(self):
+        """Check if the local copy of cover_image_url is present and still for the current URL"""
+        return bool(self.cover_cache) and bool(self.cover_image_url) and self.cover_cache_url == self.cover_image_url
+    
     def get_cover_image(self):
-        """Returns cover image URL (uploaded file takes priority over URL)"""
+        """Returns cover image URL (uploaded file, then cached copy of the URL, then the URL itself)"""
         if self.cover_image:
             return self.cover_image.url
+        elif self.has_cached_cover():
+            return self.cover_cache.url
         elif self.cover_image_url:
             return self.cover_image_url
         return None
     
+    def get_cover_renditions(self):
+        """Returns resized cover URLs as {size: {'jpeg': url, 'webp': url}} for local covers"""
+        if self.cover_image:
+            return rendition_urls(self.cover_image.name, self.cover_image.storage)
+        elif self.has_cached_cover():
+            return rendition_urls(self.cover_cache.name, self.cover_cache.storage)
+        return None
+    
     def is_on_sale(self):
         """Check if book is on sale (has original price higher than current price)"""
         return self.original_price and self.original_price > self.price
@@ -79,12 +179,24 @@ class Book(models.Model):
         """Check if book is in stock"""
         return self.stock_quantity > 0 and self.is_available
     
+    def add_rating(self, rating):
+        """Fold one new review into the stored rating aggregates with a single atomic UPDATE"""
+        new_sum = F('rating_sum') + rating
+        new_count = F('total_reviews') + 1
+        Book.objects.filter(pk=self.pk).update(
+            rating_sum=new_sum,
+            total_reviews=new_count,
+            average_rating=average_rating_expression(new_sum, new_count),
+            updated_at=timezone.now(),
+        )
+    
     def get_rating_stars(self):
         """Get star rating display"""
         full_stars = int(self.average_rating)
         half_star = 1 if (self.average_rating - full_stars) >= 0.5 else 0
         empty_stars = 5 - full_stars - half_star
-        return {'full': full_stars, 'half': half_star, 'empty': empty_stars}
+        # Ranges so templates can loop over them to draw each star
+        return {'full': range(full_stars), 'half': half_star, 'empty': range(empty_stars)}
 
 
 class Review(models.Model):
@@ -96,6 +208,8 @@ class Review(models.Model):
     title = models.CharField(max_length=200, blank=True)
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set once the rating has been folded into the book's aggregates
+    rating_applied = models.BooleanField(default=False, editable=False)
     
     class Meta:
         unique_together = ['book', 'user']  # One review per user per book
@@ -113,11 +227,25 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
     
+    def get_summary(self):
+        """Total items and price for the cart, computed in a single aggregate query"""
+        line_total = ExpressionWrapper(
+            F('quantity') * F('book__price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+        summary = self.cart_items.aggregate(
+            total_items=Coalesce(Sum('quantity'), 0),
+            total_price=Coalesce(Sum(line_total), Decimal('0.00'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        )
+        # SQLite does decimal arithmetic in floating point
+        summary['total_price'] = Decimal(summary['total_price']).quantize(Decimal('0.01'))
+        return summary
+    
     def get_total_price(self):
-        return sum(item.get_total_price() for item in self.cart_items.all())
+        return self.get_summary()['total_price']
     
     def get_total_items(self):
-        return sum(item.quantity for item in self.cart_items.all())
+        return self.get_summary()['total_items']
 
 
 class CartItem(models.Model):
@@ -143,5 +271,90 @@ class Wishlist(models.Model):
     
     def __str__(self):
         return f"Wishlist for {self.user.username}"
+
+    def contains(self, book):
+        """Membership test on the through table's unique index, without loading the books"""
+        return Wishlist.books.through.objects.filter(wishlist_id=self.pk, book_id=book.pk).exists()
     
 
+
+
+class Order(models.Model):
+    """A checkout. Pending orders hold their items' stock until ``expires_at``."""
+    PENDING = 'pending'
+    CONFIRMED = 'confirmed'
+    CANCELLED = 'cancelled'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (CONFIRMED, 'Confirmed'),
+        (CANCELLED, 'Cancelled'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The sweeper's scan: pending orders by expiry
+            models.Index(fields=['expires_at'], condition=Q(status='pending'), name='order_pending_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.pk} for {self.user.username} ({self.status})"
+
+    def is_pending(self):
+        return self.status == self.PENDING and self.expires_at > timezone.now()
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    book = models.ForeignKey(Book, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.book.title}"
+
+    def get_total_price(self):
+        return self.quantity * self.unit_price
+
+
+class BookNeighbor(models.Model):
+    """Precomputed "customers also liked" list, see admin_app.recommendations"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='book_neighbor_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} (#{self.rank})"
+
+
+class UserRecommendation(models.Model):
+    """Precomputed personal recommendations, see admin_app.recommendations"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommended_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['user', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='user_recommendation_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.book_id} (#{self.rank})"
@@ -0,0 +1,124 @@
+"""Checkout with oversell-safe stock reservation.
+
+Stock is taken with a single conditional UPDATE per title
+(``stock_quantity = stock_quantity - n WHERE stock_quantity >= n``), so
+concurrent checkouts never read-modify-write the same row and the database
+refuses anything that would go negative. Reserved stock belongs to a pending
+``Order`` until it is confirmed; if that does not happen before
+``expires_at``, ``release_expired`` hands it back in bulk.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .caching import bump_catalog_version
+from .models import Book, Order, OrderItem
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class OutOfStock(CheckoutError):
+
+    def __init__(self, book):
+        self.book = book
+        super().__init__(f"Not enough copies of '{book.title}' left in stock")
+
+
+def reserve_stock(book_id, quantity):
+    """Take ``quantity`` copies of a book; False if there are not enough"""
+    return Book.objects.filter(
+        pk=book_id, is_available=True, stock_quantity__gte=quantity,
+    ).update(stock_quantity=F('stock_quantity') - quantity) == 1
+
+
+def checkout(cart, hold=None):
+    """Turn ``cart`` into a pending order holding its stock for ``hold``.
+
+    Raises OutOfStock (and rolls everything back) if any title runs short.
+    """
+    hold = hold or timedelta(minutes=settings.ORDER_HOLD_MINUTES)
+    with transaction.atomic():
+        items = list(cart.cart_items.select_related('book').order_by('book_id'))
+        if not items:
+            raise CheckoutError('Your cart is empty')
+        order = Order.objects.create(
+            user_id=cart.user_id,
+            total_price=sum(item.quantity * item.book.price for item in items),
+            expires_at=timezone.now() + hold,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, book=item.book, quantity=item.quantity, unit_price=item.book.price)
+            for item in items
+        ])
+        cart.cart_items.all().delete()
+        # Reserve last, in book id order: row locks on popular titles are then
+        # held only until the commit right after, and never taken in an order
+        # that could deadlock against another checkout.
+        for item in items:
+            if not reserve_stock(item.book_id, item.quantity):
+                raise OutOfStock(item.book)
+        if Book.objects.filter(pk__in=[item.book_id for item in items], stock_quantity=0).exists():
+            transaction.on_commit(bump_catalog_version)
+    return order
+
+
+def confirm_order(order):
+    """Make a pending, unexpired order final; False if it is too late"""
+    now = timezone.now()
+    confirmed = Order.objects.filter(
+        pk=order.pk, status=Order.PENDING, expires_at__gt=now,
+    ).update(status=Order.CONFIRMED, updated_at=now)
+    if confirmed:
+        order.status = Order.CONFIRMED
+    return bool(confirmed)
+
+
+def cancel_order(order):
+    """Cancel a pending order and return its stock; False if it was not pending"""
+    with transaction.atomic():
+        cancelled = Order.objects.filter(pk=order.pk, status=Order.PENDING).update(
+            status=Order.CANCELLED, updated_at=timezone.now(),
+        )
+        if cancelled:
+            _restock([order.pk])
+            transaction.on_commit(bump_catalog_version)
+    if cancelled:
+        order.status = Order.CANCELLED
+    return bool(cancelled)
+
+
+def release_expired(now=None, batch_size=500):
+    """Expire overdue pending orders and return their stock; returns the count"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked lets several sweepers share the backlog on databases
+            # with row locks; elsewhere select_for_update is a no-op.
+            order_ids = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status=Order.PENDING, expires_at__lte=now)
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            Order.objects.filter(pk__in=order_ids).update(status=Order.EXPIRED, updated_at=now)
+            _restock(order_ids)
+        released += len(order_ids)
+    if released:
+        bump_catalog_version()
+    return released
+
+
+def _restock(order_ids):
+    """Add the items of ``order_ids`` back to stock in one UPDATE"""
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    returned = items.filter(book=OuterRef('pk')).values('book').annotate(total=Sum('quantity')).values('total')
+    Book.objects.filter(pk__in=items.values('book')).update(
+        stock_quantity=F('stock_quantity') + Subquery(returned),
+    )
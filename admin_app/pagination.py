@@ -0,0 +1,138 @@
+"""Keyset (cursor) pagination.
+
+Pages are addressed by the sort key of the last row seen rather than by an
+OFFSET, so every page costs one index range scan no matter how deep it is and
+rows inserted meanwhile never shift later pages. The row id is always appended
+as a tiebreaker so the ordering is total. A cursor records the ordering it
+was made for and is rejected under any other.
+"""
+import base64
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values, ordering, reverse=False):
+    payload = json.dumps(
+        {'o': ordering, 'v': [_encode_value(v) for v in values], 'r': reverse}, separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(ordering, [sort value, id], reverse)``"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        ordering, values, reverse = payload['o'], payload['v'], bool(payload.get('r'))
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+    if not isinstance(ordering, str) or not isinstance(values, list) or len(values) != 2:
+        raise InvalidCursor(token)
+    if not all(isinstance(value, (str, int, float)) for value in values):
+        raise InvalidCursor(token)
+    return ordering, values, reverse
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` by ``ordering`` (e.g. ``'-price'``) plus an id tiebreaker"""
+
+    def __init__(self, queryset, ordering, per_page=25):
+        ordering = ordering or (queryset.model._meta.ordering or ['-id'])[0]
+        self.queryset = queryset
+        self.ordering = ordering
+        self.field = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        self.per_page = per_page
+
+    def _to_python(self, name, value):
+        try:
+            return self.queryset.model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            return value
+
+    def _order(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return [prefix + self.field, prefix + 'id'], descending
+
+    def _after(self, values, descending):
+        try:
+            value, pk = self._to_python(self.field, values[0]), self._to_python('id', values[1])
+        except (ValidationError, TypeError):
+            raise InvalidCursor(values)
+        if value is None or pk is None:
+            raise InvalidCursor(values)
+        op = 'lt' if descending else 'gt'
+        # The redundant lte/gte bound lets the database seek into the index
+        # instead of walking it from the start to evaluate the OR
+        return Q(**{f'{self.field}__{op}e': value}) & (Q(**{f'{self.field}__{op}': value}) | Q(**{f'id__{op}': pk}))
+
+    def _key(self, obj):
+        return [getattr(obj, self.field), obj.pk]
+
+    def page(self, cursor=None):
+        """Return the page after (or, for a reversed cursor, before) ``cursor``"""
+        ordering, values, reverse = decode_cursor(cursor) if cursor else (self.ordering, None, False)
+        if ordering != self.ordering:
+            raise InvalidCursor(cursor)
+        order_by, descending = self._order(reverse)
+        queryset = self.queryset.order_by(*order_by)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, descending))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor(self._key(rows[-1]), self.ordering)
+            if values is not None and (has_more or not reverse):
+                previous_cursor = encode_cursor(self._key(rows[0]), self.ordering, reverse=True)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def paginate(queryset, ordering, cursor=None, per_page=25):
+    """Return a ``KeysetPage``, falling back to the first page for a bad cursor"""
+    paginator = KeysetPaginator(queryset, ordering, per_page=per_page)
+    try:
+        return paginator.page(cursor)
+    except InvalidCursor:
+        return paginator.page()
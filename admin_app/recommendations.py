@@ -0,0 +1,122 @@
+"""Offline item-item recommendations.
+
+``rebuild_recommendations`` reads every user's interactions (reviews,
+wishlists, carts and confirmed orders) and builds a sparse book-to-book
+co-occurrence table. It stores each book's top neighbours by cosine
+similarity in ``BookNeighbor`` and each user's top unseen books in
+``UserRecommendation``. Pages then read them with one indexed lookup on
+``(book, rank)`` or ``(user, rank)``.
+
+Co-occurrences are counted per user basket with plain dicts rather than
+matrix products. The interaction matrix is very sparse, so the cost is
+the sum of squared basket sizes either way, and no numeric library is
+needed.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .models import BookNeighbor, CartItem, Order, OrderItem, Review, UserRecommendation, Wishlist
+
+TOP_K = 20
+# Caps the quadratic pair count for users with very large wishlists
+MAX_BASKET = 200
+
+WISHLIST_WEIGHT = 1.0
+CART_WEIGHT = 1.0
+ORDER_WEIGHT = 1.5
+
+
+def review_weight(rating):
+    # 3 stars is lukewarm, 5 is a strong signal; 1-2 stars are not "liked"
+    return (rating - 2) / 3 if rating >= 3 else 0
+
+
+def interactions():
+    """Yield (user_id, book_id, weight) for every signal we learn from"""
+    for user_id, book_id, rating in Review.objects.values_list('user_id', 'book_id', 'rating').iterator():
+        weight = review_weight(rating)
+        if weight:
+            yield user_id, book_id, weight
+    wishlisted = Wishlist.books.through.objects.values_list('wishlist__user_id', 'book_id')
+    for user_id, book_id in wishlisted.iterator():
+        yield user_id, book_id, WISHLIST_WEIGHT
+    for user_id, book_id in CartItem.objects.values_list('cart__user_id', 'book_id').iterator():
+        yield user_id, book_id, CART_WEIGHT
+    ordered = OrderItem.objects.filter(order__status=Order.CONFIRMED).values_list('order__user_id', 'book_id')
+    for user_id, book_id in ordered.iterator():
+        yield user_id, book_id, ORDER_WEIGHT
+
+
+def build_baskets(rows):
+    """{user_id: {book_id: weight}}, keeping each pair's strongest signal"""
+    baskets = defaultdict(dict)
+    for user_id, book_id, weight in rows:
+        basket = baskets[user_id]
+        if weight > basket.get(book_id, 0):
+            basket[book_id] = weight
+    return baskets
+
+
+def book_neighbors(baskets, top_k=TOP_K):
+    """{book_id: [(similarity, neighbor_id), ...]} best first"""
+    cooccurrence = defaultdict(Counter)
+    norms = Counter()
+    for basket in baskets.values():
+        items = heapq.nlargest(MAX_BASKET, basket.items(), key=lambda item: item[1])
+        for book_id, weight in items:
+            norms[book_id] += weight * weight
+            counts = cooccurrence[book_id]
+            for other_id, other_weight in items:
+                if other_id != book_id:
+                    counts[other_id] += weight * other_weight
+    return {
+        book_id: heapq.nlargest(top_k, (
+            (score / math.sqrt(norms[book_id] * norms[other_id]), other_id)
+            for other_id, score in counts.items()
+        ))
+        for book_id, counts in cooccurrence.items()
+    }
+
+
+def user_recommendations(baskets, neighbors, top_k=TOP_K):
+    """{user_id: [(score, book_id), ...]} of books the user has not interacted with"""
+    recommendations = {}
+    for user_id, basket in baskets.items():
+        scores = Counter()
+        for book_id, weight in basket.items():
+            for similarity, other_id in neighbors.get(book_id, ()):
+                if other_id not in basket:
+                    scores[other_id] += weight * similarity
+        if scores:
+            recommendations[user_id] = heapq.nlargest(top_k, ((score, book_id) for book_id, score in scores.items()))
+    return recommendations
+
+
+def rebuild_recommendations(top_k=TOP_K, batch_size=2000):
+    """Recompute and replace every stored neighbour list and recommendation"""
+    baskets = build_baskets(interactions())
+    neighbors = book_neighbors(baskets, top_k)
+    recommendations = user_recommendations(baskets, neighbors, top_k)
+    with transaction.atomic():
+        BookNeighbor.objects.all().delete()
+        BookNeighbor.objects.bulk_create(
+            (
+                BookNeighbor(book_id=book_id, neighbor_id=other_id, rank=rank, score=score)
+                for book_id, ranked in neighbors.items()
+                for rank, (score, other_id) in enumerate(ranked, start=1)
+            ),
+            batch_size=batch_size,
+        )
+        UserRecommendation.objects.all().delete()
+        UserRecommendation.objects.bulk_create(
+            (
+                UserRecommendation(user_id=user_id, book_id=book_id, rank=rank, score=score)
+                for user_id, ranked in recommendations.items()
+                for rank, (score, book_id) in enumerate(ranked, start=1)
+            ),
+            batch_size=batch_size,
+        )
+    return len(neighbors), len(recommendations)
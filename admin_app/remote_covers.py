@@ -0,0 +1,148 @@
+"""Local caching of remote cover images.
+
+Books that only have ``cover_image_url`` are fetched once, normalised to a
+bounded-size JPEG stored in ``Book.cover_cache`` (with the usual renditions)
+and served from our own storage afterwards. The response's ETag and
+Last-Modified headers are kept so later revalidation is a cheap conditional
+GET that usually ends in a 304. Saving a book fetches its cover in the
+background; ``refresh_covers`` revalidates the rest from the hourly
+``cache_remote_covers`` task or the management command of the same name.
+"""
+import http.client
+import logging
+import urllib.error
+import urllib.request
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .caching import bump_catalog_version
+from .images import generate_renditions
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+FETCHED = 'fetched'
+NOT_MODIFIED = 'not_modified'
+FAILED = 'failed'
+
+TIMEOUT = 10
+MAX_BYTES = 10 * 1024 * 1024
+MAX_SIZE = (800, 1200)
+USER_AGENT = 'OnlineBookstore-CoverCache/1.0'
+
+
+def _request(book):
+    request = urllib.request.Request(book.cover_image_url, headers={'User-Agent': USER_AGENT})
+    # Only revalidate when the cached copy belongs to the current URL
+    if book.has_cached_cover():
+        if book.cover_cache_etag:
+            request.add_header('If-None-Match', book.cover_cache_etag)
+        if book.cover_cache_last_modified:
+            request.add_header('If-Modified-Since', book.cover_cache_last_modified)
+    return request
+
+
+def _normalize(data):
+    image = Image.open(BytesIO(data))
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _mark_checked(book, now):
+    """Record an attempt on the current URL, so saving the book again does not retry it"""
+    book.cover_cache_checked_at = now
+    book.cover_cache_checked_url = book.cover_image_url
+    Book.objects.filter(pk=book.pk).update(cover_cache_checked_at=now, cover_cache_checked_url=book.cover_image_url)
+
+
+def fetch_cover(book, timeout=TIMEOUT):
+    """Fetch or revalidate the cached copy of ``book.cover_image_url``.
+
+    Returns FETCHED, NOT_MODIFIED or FAILED. Book rows are written with
+    ``update()`` so caching never touches ``updated_at`` or fires signals.
+    """
+    if not book.cover_image_url:
+        return FAILED
+    now = timezone.now()
+    try:
+        with urllib.request.urlopen(_request(book), timeout=timeout) as response:
+            data = response.read(MAX_BYTES + 1)
+            headers = response.headers
+    except urllib.error.HTTPError as exc:
+        if exc.code == 304:
+            _mark_checked(book, now)
+            return NOT_MODIFIED
+        logger.warning('Cover fetch for book %s failed: HTTP %s', book.pk, exc.code)
+        _mark_checked(book, now)
+        return FAILED
+    except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as exc:
+        logger.warning('Cover fetch for book %s failed: %s', book.pk, exc)
+        _mark_checked(book, now)
+        return FAILED
+
+    if len(data) > MAX_BYTES:
+        logger.warning('Cover for book %s exceeds %s bytes', book.pk, MAX_BYTES)
+        _mark_checked(book, now)
+        return FAILED
+    try:
+        normalized = _normalize(data)
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning('Cover for book %s is not a usable image: %s', book.pk, exc)
+        _mark_checked(book, now)
+        return FAILED
+
+    field = book.cover_cache
+    old_name = field.name if field else None
+    field.save(f'book_{book.pk}.jpg', ContentFile(normalized), save=False)
+    if old_name and old_name != field.name:
+        field.storage.delete(old_name)
+    generate_renditions(field.name, storage=field.storage)
+
+    book.cover_cache_url = book.cover_image_url
+    book.cover_cache_etag = headers.get('ETag', '')[:200]
+    book.cover_cache_last_modified = headers.get('Last-Modified', '')[:64]
+    book.cover_cache_checked_at = now
+    book.cover_cache_checked_url = book.cover_image_url
+    Book.objects.filter(pk=book.pk).update(
+        cover_cache=field.name,
+        cover_cache_url=book.cover_cache_url,
+        cover_cache_etag=book.cover_cache_etag,
+        cover_cache_last_modified=book.cover_cache_last_modified,
+        cover_cache_checked_at=now,
+        cover_cache_checked_url=book.cover_cache_checked_url,
+    )
+    return FETCHED
+
+
+def covers_to_refresh(revalidate_after):
+    """Books with a remote cover that was never checked or is due for revalidation"""
+    stale_before = timezone.now() - revalidate_after
+    return (
+        Book.objects.exclude(cover_image_url=None).exclude(cover_image_url='')
+        .filter(Q(cover_image='') | Q(cover_image=None))
+        .filter(Q(cover_cache_checked_at=None) | Q(cover_cache_checked_at__lt=stale_before))
+    )
+
+
+def refresh_covers(revalidate_after, limit=None, timeout=TIMEOUT):
+    """Fetch or revalidate every cover ``covers_to_refresh`` picks; returns {result: count}"""
+    books = covers_to_refresh(revalidate_after).order_by('id')
+    if limit:
+        books = books[:limit]
+    results = {}
+    for book in books.iterator():
+        result = fetch_cover(book, timeout=timeout)
+        results[result] = results.get(result, 0) + 1
+    if results.get(FETCHED):
+        bump_catalog_version()
+    return results
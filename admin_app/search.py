@@ -0,0 +1,199 @@
+"""Full-text search over the book catalogue.
+
+SQLite keeps an FTS5 virtual table keyed on the book id and PostgreSQL keeps a
+side table holding a weighted ``tsvector`` with a GIN index. Both are filled by
+the ``Book`` signals in ``admin_app.signals`` and can be rebuilt from scratch
+with ``manage.py rebuild_search_index``. Any other database falls back to the
+old ``icontains`` scan.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SQLITE_TABLE = 'admin_app_book_fts'
+POSTGRES_TABLE = 'admin_app_book_search'
+
+# Column weights used for ranking: title, author, isbn, description
+SQLITE_WEIGHTS = '10.0, 5.0, 10.0, 1.0'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Split user input into bare search terms (quotes and operators dropped)"""
+    return TOKEN_RE.findall(query or '')
+
+
+class BaseSearchBackend:
+    """Plain LIKE scan, used when the database has no full-text support"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(author__icontains=query) |
+            Q(isbn__icontains=query) |
+            Q(description__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def create_index(self, cursor):
+        pass
+
+    def drop_index(self, cursor):
+        pass
+
+    def index_books(self, books):
+        pass
+
+    def remove_books(self, book_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self, queryset, batch_size=2000):
+        """Re-index every book in ``queryset`` in batches; returns the number indexed"""
+        self.clear()
+        total = 0
+        batch = []
+        fields = ('id', 'title', 'author', 'isbn', 'description')
+        for book in queryset.only(*fields).iterator(chunk_size=batch_size):
+            batch.append(book)
+            if len(batch) >= batch_size:
+                self.index_books(batch)
+                total += len(batch)
+                batch = []
+        self.index_books(batch)
+        return total + len(batch)
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 index ranked with bm25 and prefix matching on every term"""
+
+    def match_expression(self, query):
+        return ' '.join('"%s"*' % term for term in tokenize(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        # Join the index once so a single MATCH yields both the matching rows
+        # and their rank; a correlated rank subquery would re-run the MATCH
+        # for every candidate row. The ORM cannot join a table without a
+        # model, hence extra().
+        queryset = queryset.extra(
+            tables=[SQLITE_TABLE],
+            where=[f'{SQLITE_TABLE} MATCH %s', f'{SQLITE_TABLE}.rowid = {table}.id'],
+            params=[match],
+        )
+        # bm25() is lower-is-better; negate so callers can order by -search_rank
+        return queryset.annotate(search_rank=RawSQL(f'-bm25({SQLITE_TABLE}, {SQLITE_WEIGHTS})', []))
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5('
+            "title, author, isbn, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+
+    def index_books(self, books):
+        rows = [(b.id, b.title, b.author, b.isbn or '', b.description) for b in books]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [(r[0],) for r in rows])
+            cursor.executemany(
+                f'INSERT INTO {SQLITE_TABLE} (rowid, title, author, isbn, description) '
+                'VALUES (%s, %s, %s, %s, %s)', rows
+            )
+
+    def remove_books(self, book_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [(i,) for i in book_ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE}')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector side table ranked with ts_rank"""
+
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector('simple', coalesce(%s, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(%s, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(%s, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(%s, '')), 'D')"
+    )
+
+    def match_expression(self, query):
+        return ' & '.join('%s:*' % term for term in tokenize(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        matched_ids = RawSQL(
+            f"SELECT book_id FROM {POSTGRES_TABLE} WHERE document @@ to_tsquery('simple', %s)", [match]
+        )
+        rank = RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {POSTGRES_TABLE} "
+            f"WHERE book_id = {table}.id", [match]
+        )
+        return queryset.filter(id__in=matched_ids).annotate(search_rank=rank)
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ('
+            'book_id bigint PRIMARY KEY REFERENCES admin_app_book (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_idx '
+            f'ON {POSTGRES_TABLE} USING GIN (document)'
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {POSTGRES_TABLE}')
+
+    def index_books(self, books):
+        rows = [(b.id, b.title, b.author, b.isbn or '', b.description) for b in books]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {POSTGRES_TABLE} (book_id, document) VALUES (%s, {self.DOCUMENT_SQL}) '
+                'ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document', rows
+            )
+
+    def remove_books(self, book_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {POSTGRES_TABLE} WHERE book_id = %s', [(i,) for i in book_ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {POSTGRES_TABLE}')
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    """Return the search backend matching the vendor of database ``using``"""
+    return BACKENDS.get(connections[using].vendor, BaseSearchBackend)(using)
+
+
+def search_books(queryset, query):
+    """Filter ``queryset`` down to books matching ``query``, annotated with search_rank"""
+    return get_backend().search(queryset, query)
@@ -0,0 +1,55 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_wishlist
+from .models import Book, Category, Wishlist
+from .tasks import (
+    cache_remote_cover, enqueue, enqueue_in_background, invalidate_catalog_cache, sync_search_index,
+    update_autocomplete,
+)
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, **kwargs):
+    """Queue index, cache and cover updates for the saved book"""
+    enqueue(sync_search_index, [instance.pk])
+    enqueue(update_autocomplete, [instance.pk])
+    if instance.cover_image_url and not instance.cover_image and instance.cover_cache_checked_at is None:
+        # Up to remote_covers.TIMEOUT seconds; keep it out of the admin request
+        enqueue_in_background(cache_remote_cover, instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    enqueue(sync_search_index, [instance.pk])
+    enqueue(update_autocomplete, [instance.pk])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    """Orphan cached storefront fragments built from the old catalogue"""
+    enqueue(invalidate_catalog_cache)
+
+
+@receiver(m2m_changed, sender=Wishlist.books.through)
+def wishlist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop the cached wishlist sets of every user whose wishlist changed"""
+    if not reverse:
+        if not action.startswith('post_'):
+            return
+        user_ids = [instance.user_id]
+    elif action == 'pre_clear':
+        # Afterwards there is no telling whose wishlists held the book
+        user_ids = list(Wishlist.objects.filter(books=instance).values_list('user_id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        user_ids = list(Wishlist.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+    else:
+        return
+    for user_id in user_ids:
+        transaction.on_commit(partial(invalidate_wishlist, user_id))
@@ -0,0 +1,131 @@
+"""Slow-query log.
+
+``PerformanceMiddleware`` installs a ``SlowQueryLogger`` as an execute
+wrapper for each request. A query taking longer than
+``SLOW_QUERY_THRESHOLD_MS`` is written to the ``admin_app.slow_queries``
+logger as one JSON line. The line holds the SQL, the view, the project
+frames of the Python stack and a normalised fingerprint. Settings route
+that logger to a rotating file. A ``SLOW_QUERY_EXPLAIN_RATE`` fraction of
+slow SELECTs is also re-run under the backend's EXPLAIN prefix (``EXPLAIN
+QUERY PLAN`` on SQLite, ``EXPLAIN`` on PostgreSQL) to record the plan.
+
+Parameters are not logged because they can hold personal data; the
+fingerprint groups queries without them. The ``slow_query_report``
+command summarises the log by fingerprint.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import traceback
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+logger = logging.getLogger(__name__)
+
+# Innermost project frames kept per record
+STACK_DEPTH = 12
+# The execute wrappers themselves are never the origin of a query
+INSTRUMENTATION_FILES = {__file__, str(Path(__file__).with_name('metrics.py'))}
+MAX_SQL_LENGTH = 10000
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+# Writes and DDL are logged but not explained
+READ_QUERY = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+
+def normalize(sql):
+    """SQL with literals, placeholders and IN lists collapsed to ``?``"""
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql.replace('%s', '?'))
+    sql = PLACEHOLDER_LIST.sub('(?)', sql)
+    return ' '.join(sql.split())
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:16]
+
+
+def project_stack():
+    """Frames from this project's code, innermost last"""
+    base = str(settings.BASE_DIR)
+    frames = [
+        f'{Path(frame.filename).relative_to(base)}:{frame.lineno} in {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base)
+        and 'site-packages' not in frame.filename
+        and frame.filename not in INSTRUMENTATION_FILES
+    ]
+    return frames[-STACK_DEPTH:]
+
+
+def explain(connection, sql, params):
+    """The query plan as a list of lines"""
+    # Run outside the execute wrappers so the plan is neither timed, counted
+    # nor logged as part of the request
+    wrappers, connection.execute_wrappers = connection.execute_wrappers, []
+    try:
+        # Inside a transaction a failed EXPLAIN must not break it; in
+        # autocommit a bare statement is enough, and SQLite's BEGIN IMMEDIATE
+        # would take the write lock
+        with transaction.atomic(using=connection.alias) if connection.in_atomic_block else nullcontext():
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError as exc:
+        return [f'EXPLAIN failed: {exc}']
+    finally:
+        connection.execute_wrappers = wrappers
+
+
+class SlowQueryLogger:
+    """connection.execute_wrapper hook logging queries above the threshold"""
+
+    def __init__(self, request, threshold_ms, explain_rate):
+        self.request = request
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - started
+        if duration >= self.threshold:
+            self.record(sql, params, many, duration, context['connection'])
+        return result
+
+    def record(self, sql, params, many, duration, connection):
+        match = self.request.resolver_match
+        entry = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'threshold_ms': round(self.threshold * 1000, 3),
+            'database': connection.alias,
+            'vendor': connection.vendor,
+            'view': match.view_name if match else None,
+            'method': self.request.method,
+            'path': self.request.path,
+            'fingerprint': fingerprint(sql),
+            'sql': sql[:MAX_SQL_LENGTH],
+            'stack': project_stack(),
+            'plan': None,
+        }
+        if not many and READ_QUERY.match(sql) and random.random() < self.explain_rate:
+            entry['plan'] = explain(connection, sql, params)
+        logger.info(json.dumps(entry))
+
+
+def for_request(request):
+    """A SlowQueryLogger for ``request``, or None when the log is disabled"""
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if threshold is None:
+        return None
+    return SlowQueryLogger(request, threshold, getattr(settings, 'SLOW_QUERY_EXPLAIN_RATE', 0))
@@ -0,0 +1,114 @@
+"""Background tasks for post-write side effects.
+
+Every task is idempotent: it re-reads current database state (or claims its
+work with a conditional UPDATE) so a retried or duplicated message is
+harmless. Use ``enqueue`` so tasks are only sent once the triggering
+transaction has committed.
+"""
+import threading
+from datetime import timedelta
+from functools import partial
+
+from celery import shared_task
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import autocomplete
+from .caching import bump_catalog_version
+from .models import Book, Review
+from .orders import release_expired
+from .recommendations import rebuild_recommendations
+from .remote_covers import FETCHED, fetch_cover, refresh_covers
+from .search import get_backend
+
+
+def enqueue(task, *args):
+    transaction.on_commit(partial(task.delay, *args))
+
+
+def _run_in_thread(task, *args):
+    try:
+        task.delay(*args)
+    finally:
+        connections.close_all()
+
+
+def send_in_background(task, *args):
+    """Send ``task`` now, running it in a thread when eager so it stays off the request"""
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        threading.Thread(target=_run_in_thread, args=(task, *args), daemon=True).start()
+    else:
+        task.delay(*args)
+
+
+def enqueue_in_background(task, *args):
+    """``enqueue`` for slow tasks: without a broker they run in a thread, not the request"""
+    transaction.on_commit(partial(send_in_background, task, *args))
+
+
+@shared_task
+def sync_search_index(book_ids):
+    """Bring the full-text index in line with the current rows for ``book_ids``"""
+    books = list(Book.objects.filter(pk__in=book_ids).only('id', 'title', 'author', 'isbn', 'description'))
+    backend = get_backend()
+    backend.index_books(books)
+    deleted = set(book_ids) - {book.pk for book in books}
+    if deleted:
+        backend.remove_books(deleted)
+
+
+@shared_task
+def update_autocomplete(book_ids):
+    autocomplete.update_books(book_ids)
+
+
+@shared_task
+def rebuild_autocomplete():
+    return autocomplete.rebuild()
+
+
+@shared_task
+def invalidate_catalog_cache():
+    bump_catalog_version()
+
+
+@shared_task
+def apply_review_rating(review_id):
+    """Fold a new review into its book's rating aggregates exactly once"""
+    with transaction.atomic():
+        claimed = Review.objects.filter(pk=review_id, rating_applied=False).update(rating_applied=True)
+        if not claimed:
+            return False
+        review = Review.objects.only('book_id', 'rating').get(pk=review_id)
+        Book(pk=review.book_id).add_rating(review.rating)
+    bump_catalog_version()
+    return True
+
+
+@shared_task
+def cache_remote_cover(book_id):
+    book = Book.objects.filter(pk=book_id).first()
+    if book is None or book.cover_image or not book.cover_image_url or book.has_cached_cover():
+        return None
+    result = fetch_cover(book)
+    if result == FETCHED:
+        bump_catalog_version()
+    return result
+
+
+@shared_task
+def cache_remote_covers(revalidate_after_hours=24):
+    """Periodic fetch of new remote covers and revalidation of cached ones"""
+    return refresh_covers(timedelta(hours=revalidate_after_hours))
+
+
+@shared_task
+def release_expired_orders():
+    """Periodic sweep returning the stock of orders whose hold ran out"""
+    return release_expired()
+
+
+@shared_task
+def build_recommendations():
+    """Nightly rebuild of related books and per-user recommendations"""
+    return rebuild_recommendations()
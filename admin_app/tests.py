@@ -1,3 +1,929 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections as db_connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from user_app.tests import QueryBudgetMixin
+
+from . import autocomplete
+from .forms import BookForm
+from .images import RENDITIONS, rendition_name
+from .isbn import normalize_isbn
+from .models import (
+    Book, BookNeighbor, Cart, CartItem, Category, Order, OrderItem, Review, UserRecommendation, Wishlist,
+)
+from .orders import OutOfStock, cancel_order, checkout, confirm_order, release_expired
+from .remote_covers import FAILED, FETCHED, NOT_MODIFIED, covers_to_refresh, fetch_cover
+from .search import SQLITE_TABLE, get_backend, search_books
+from .slow_queries import fingerprint, normalize
+from .tasks import cache_remote_cover, cache_remote_covers, send_in_background, sync_search_index
+from .pagination import InvalidCursor, KeysetPaginator, encode_cursor
+from .recommendations import rebuild_recommendations
+
+
+class IsbnTests(TestCase):
+
+    def book_data(self, **kwargs):
+        return {
+            'title': 'T', 'author': 'A', 'price': 1, 'description': 'x',
+            'language': 'English', 'condition': 'new', 'stock_quantity': 1, **kwargs,
+        }
+
+    def test_normalize(self):
+        self.assertEqual(normalize_isbn('0306406152'), '9780306406157')
+        # An X check digit in either case, with hyphens or spaces
+        self.assertEqual(normalize_isbn('0-8044-2957-x'), '9780804429573')
+        self.assertEqual(normalize_isbn('080442957X'), '9780804429573')
+        self.assertEqual(normalize_isbn('978 0 306 40615 7'), '9780306406157')
+        self.assertEqual(normalize_isbn('978-0-306-40615-7'), '9780306406157')
+
+    def test_wrong_check_digit_is_rejected(self):
+        for value in ['0306406153', '9780306406158', '12345', '979-0-306-40615-7X']:
+            with self.subTest(value=value):
+                self.assertIsNone(normalize_isbn(value))
+        form = BookForm(self.book_data(isbn='0306406153'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('isbn', form.errors)
+
+    def test_form_and_model_store_bare_isbn13_or_null(self):
+        form = BookForm(self.book_data(isbn='0-306-40615-2'))
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().isbn, '9780306406157')
+
+        form = BookForm(self.book_data(isbn=''))
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNone(form.save().isbn)
+        # Blank ISBNs are NULL, so any number of books can lack one
+        self.assertIsNone(Book.objects.create(title='U', author='A', price=1, description='x', isbn='').isbn)
+        self.assertEqual(Book.objects.filter(isbn=None).count(), 2)
+        book = Book.objects.create(title='V', author='A', price=1, description='x', isbn='080442957x')
+        self.assertEqual(book.isbn, '9780804429573')
+
+    def test_catalog_redirects_on_exact_isbn(self):
+        book = Book.objects.create(title='Found', author='A', price=1, description='x', isbn='9780306406157')
+        response = self.client.get(reverse('book_catalog'), {'query': '0-306-40615-2'})
+        self.assertRedirects(response, reverse('book_detail', args=[book.id]))
+
+        # A valid ISBN with no matching book falls through to the search
+        response = self.client.get(reverse('book_catalog'), {'query': '080442957X'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Found')
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class StorefrontIndexTests(TestCase):
+    """Every storefront query shape should be answered from an index, without a sort step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(category_name='Fiction', cat_description='Stories')
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset):
+        plan = self.query_plan(queryset)
+        for step in plan:
+            self.assertNotRegex(step, r'^SCAN admin_app_book$', plan)
+            self.assertNotIn('USE TEMP B-TREE', step, plan)
+
+    def test_home_queries(self):
+        self.assertUsesIndex(Book.objects.filter(is_featured=True, is_available=True)[:6])
+        self.assertUsesIndex(Book.objects.filter(is_available=True).order_by('-created_at')[:8])
+        self.assertUsesIndex(
+            Book.objects.filter(is_available=True, average_rating__gte=4.0).order_by('-average_rating')[:6]
+        )
+
+    def test_related_books_query(self):
+        self.assertUsesIndex(
+            Book.objects.filter(category=self.category, is_available=True).exclude(id=1)[:4]
+        )
+
+    def test_dashboard_featured_fallback(self):
+        self.assertUsesIndex(Book.objects.filter(is_featured=True)[:6])
+
+    def test_catalog_pages_for_every_sort_order(self):
+        cursors = {
+            'title': 'M', 'price': '10.00', 'average_rating': '4.00',
+            'created_at': '2025-01-01T00:00:00+00:00',
+        }
+        for sort_by in ['', 'title', '-title', 'price', '-price', '-average_rating', '-created_at']:
+            with self.subTest(sort_by=sort_by):
+                paginator = KeysetPaginator(Book.objects.filter(is_available=True), sort_by)
+                order_by, descending = paginator._order(False)
+                ordered = paginator.queryset.order_by(*order_by)
+                self.assertUsesIndex(ordered[:paginator.per_page + 1])
+                after = paginator._after([cursors[paginator.field], 100], descending)
+                self.assertUsesIndex(ordered.filter(after)[:paginator.per_page + 1])
+
+    def test_admin_book_list(self):
+        self.assertUsesIndex(Book.objects.order_by('-created_at', '-id')[:51])
+
+
+class KeysetPaginatorTests(TestCase):
+
+    def setUp(self):
+        # Pairs of equal prices so pages split inside a tie
+        self.books = [
+            Book.objects.create(title=f'Book {index}', author='A', price=10 + index // 2, description='x')
+            for index in range(7)
+        ]
+        self.paginator = KeysetPaginator(Book.objects.all(), 'price', per_page=3)
+
+    def titles(self, page):
+        return [book.title for book in page]
+
+    def test_forward_and_backward(self):
+        first = self.paginator.page()
+        self.assertEqual(self.titles(first), ['Book 0', 'Book 1', 'Book 2'])
+        self.assertFalse(first.has_previous())
+        second = self.paginator.page(first.next_cursor)
+        # Book 2 and Book 3 share a price; the id tiebreaker splits them
+        self.assertEqual(self.titles(second), ['Book 3', 'Book 4', 'Book 5'])
+        last = self.paginator.page(second.next_cursor)
+        self.assertEqual(self.titles(last), ['Book 6'])
+        self.assertFalse(last.has_next())
+
+        self.assertEqual(self.titles(self.paginator.page(last.previous_cursor)), self.titles(second))
+        back = self.paginator.page(second.previous_cursor)
+        self.assertEqual(self.titles(back), self.titles(first))
+        self.assertFalse(back.has_previous())
+
+    def test_descending_ties(self):
+        paginator = KeysetPaginator(Book.objects.all(), '-price', per_page=2)
+        page, seen = paginator.page(), []
+        while True:
+            seen += self.titles(page)
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+        self.assertEqual(seen, ['Book 6', 'Book 5', 'Book 4', 'Book 3', 'Book 2', 'Book 1', 'Book 0'])
+
+    def test_invalid_cursors(self):
+        bad = [
+            'not base64!',
+            encode_cursor(['abc', 1], 'price'),
+            encode_cursor(['10.00', 'x'], 'price'),
+            encode_cursor(['10.00'], 'price'),
+            encode_cursor([None, 1], 'price'),
+            encode_cursor(['10.00', 1], '-price'),
+            encode_cursor(['x', 'y'], 'title'),
+        ]
+        for cursor in bad:
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                self.paginator.page(cursor)
+
+    def test_views_fall_back_to_the_first_page(self):
+        title_cursor = encode_cursor(['x', 'y'], 'title')
+        for url in [
+            reverse('book_catalog') + f'?sort_by=-created_at&cursor={title_cursor}',
+            reverse('book_catalog') + '?sort_by=price&cursor=' + encode_cursor(['abc', 1], 'price'),
+            reverse('api-book-list') + f'?ordering=price&cursor={title_cursor}',
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+class AdminQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Admin list views should issue the same number of queries however many rows they render"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        self.counter = 0
+
+    def add_books(self, n):
+        for _ in range(n):
+            self.counter += 1
+            category = Category.objects.create(category_name=f'Category {self.counter}', cat_description='x')
+            Book.objects.create(title=f'Book {self.counter}', author='Author', price=5, description='x', category=category)
+
+    def test_admin_dashboard(self):
+        self.assertQueriesIndependentOfRows(reverse('admin_dashboard'), self.add_books)
+
+    def test_book_list(self):
+        self.assertQueriesIndependentOfRows(reverse('book_list'), self.add_books)
+
+    def test_category_list(self):
+        self.assertQueriesIndependentOfRows(reverse('category_list'), self.add_books)
+
+
+class ExportBooksViewTests(TestCase):
+
+    def setUp(self):
+        Book.objects.create(title='Exported', author='Author', price=5, description='x')
+
+    def test_admin_gets_streamed_gzip_jsonl(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.get(reverse('export_books') + '?format=jsonl&gzip=1')
+        self.assertTrue(response.streaming)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Exported'])
+
+    def test_requires_admin(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        self.assertEqual(self.client.get(reverse('export_books')).status_code, 302)
+
+
+class ImportBooksCommandTests(TestCase):
+
+    def setUp(self):
+        self.fiction = Category.objects.create(category_name='Fiction', cat_description='x')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as handle:
+            handle.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_books', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        path = self.write('books.csv', (
+            'isbn,title,author,price,description,category,is_featured\n'
+            '978-0-306-40615-7,Dune,Frank Herbert,9.99,Sand,fiction,yes\n'
+            '9780306406157,Dune (2nd printing),Frank Herbert,10.99,Sand,Fiction,no\n'
+            ',No ISBN,Anon,5,x,,\n'
+            '9780140449136,Bad Price,Anon,abc,x,,\n'
+        ))
+        out, err = self.run_import(path)
+        self.assertIn('Imported 1 books, rejected 2 rows', out)
+        self.assertIn('isbn: required', err)
+        self.assertIn('price:', err)
+        book = Book.objects.get()
+        # Duplicate ISBNs within a batch collapse to the last row
+        self.assertEqual((book.isbn, book.title, book.category, book.is_featured), ('9780306406157', 'Dune (2nd printing)', self.fiction, False))
+        self.assertEqual(search_books(Book.objects.all(), 'printing').get(), book)
+
+    def test_jsonl_upsert_only_updates_supplied_columns(self):
+        book = Book.objects.create(
+            isbn='9780306406157', title='Old', author='A', price=5, description='x', category=self.fiction,
+            is_featured=True, stock_quantity=40, language='French', cover_image_url='https://example.com/c.jpg',
+        )
+        path = self.write('books.jsonl', json.dumps({
+            'isbn': '0-306-40615-2', 'title': 'New', 'author': 'B', 'description': 'y', 'price': '7.50',
+        }) + '\n\n')
+        out, err = self.run_import(path)
+        self.assertIn('Imported 1 books, rejected 0 rows', out)
+        book.refresh_from_db()
+        self.assertEqual((book.title, book.author, book.price), ('New', 'B', Decimal('7.50')))
+        self.assertEqual(
+            (book.is_featured, book.stock_quantity, book.language, book.category, book.cover_image_url),
+            (True, 40, 'French', self.fiction, 'https://example.com/c.jpg'),
+        )
+
+    def test_new_books_get_model_defaults(self):
+        path = self.write('books.jsonl', json.dumps({
+            'isbn': '9780140449136', 'title': 'T', 'author': 'A', 'description': 'x', 'price': 3,
+        }) + '\n')
+        self.run_import(path)
+        book = Book.objects.get()
+        self.assertEqual((book.language, book.stock_quantity, book.is_featured), ('English', 1, False))
+
+    def test_unknown_category(self):
+        path = self.write('books.csv', 'isbn,title,author,price,description,category\n9780140449136,T,A,3,x,Poetry\n')
+        out, err = self.run_import(path)
+        self.assertIn('unknown category "Poetry"', err)
+        self.assertFalse(Book.objects.exists())
+
+        self.run_import(path, create_categories=True)
+        self.assertEqual(Book.objects.get().category.category_name, 'Poetry')
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write('books.csv', 'isbn,title,author,price,description,category\n9780140449136,T,A,3,x,Poetry\n')
+        out, err = self.run_import(path, dry_run=True, create_categories=True)
+        self.assertIn('Validated 1 books, rejected 0 rows', out)
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(Category.objects.filter(category_name='Poetry').exists())
+
+
+class CoverRenditionTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, name='cover.png', size=(800, 1200)):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 255)).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_upload_generates_every_rendition(self):
+        book = Book.objects.create(
+            title='Covered', author='A', price=5, description='x', cover_image=self.upload()
+        )
+        renditions = book.get_cover_renditions()
+        self.assertEqual(set(renditions), set(RENDITIONS))
+        for size, box in RENDITIONS.items():
+            for fmt in ('jpeg', 'webp'):
+                path = os.path.join(self.media_root, rendition_name(book.cover_image.name, size, fmt))
+                with Image.open(path) as image:
+                    self.assertEqual(image.size, box)
+                    self.assertEqual(image.format, fmt.upper())
+
+    def test_plain_save_does_not_regenerate(self):
+        book = Book.objects.create(
+            title='Covered', author='A', price=5, description='x', cover_image=self.upload()
+        )
+        with mock.patch('admin_app.models.generate_renditions') as generate:
+            book.title = 'Renamed'
+            book.save()
+        generate.assert_not_called()
+
+    def test_book_without_upload_has_no_renditions(self):
+        book = Book.objects.create(title='Bare', author='A', price=5, description='x')
+        self.assertIsNone(book.get_cover_renditions())
+
+
+class CoverServer(BaseHTTPRequestHandler):
+    """Stand-in for a third-party image host, with ETag support"""
+    body = b''
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        CoverServer.requests.append(dict(self.headers))
+        if self.path == '/missing.jpg':
+            self.send_error(404)
+        elif self.path == '/garbled.png':
+            # Not an HTTP status line: http.client raises BadStatusLine
+            self.wfile.write(b'garbage\r\n\r\n')
+        elif self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('ETag', self.etag)
+            self.send_header('Last-Modified', 'Wed, 01 Jan 2025 00:00:00 GMT')
+            self.end_headers()
+            self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RemoteCoverCacheTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 2400), (10, 120, 200)).save(buffer, format='PNG')
+        CoverServer.body = buffer.getvalue()
+        cls.server = HTTPServer(('127.0.0.1', 0), CoverServer)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        CoverServer.requests = []
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        # Run the background fetch inline; a thread's connection would not see the test's rows
+        background = mock.patch('admin_app.tasks.send_in_background', lambda task, *args: task.delay(*args))
+        background.start()
+        self.addCleanup(background.stop)
+        self.book = Book.objects.create(
+            title='Remote', author='A', price=5, description='x', cover_image_url=f'{self.base_url}/cover.png'
+        )
+
+    def test_fetch_then_revalidate(self):
+        self.assertEqual(fetch_cover(self.book), FETCHED)
+        self.book.refresh_from_db()
+        self.assertTrue(self.book.has_cached_cover())
+        self.assertEqual(self.book.get_cover_image(), self.book.cover_cache.url)
+        self.assertEqual(self.book.cover_cache_etag, '"v1"')
+        with Image.open(self.book.cover_cache.path) as image:
+            self.assertLessEqual(image.size, (800, 1200))
+        self.assertIsNotNone(self.book.get_cover_renditions())
+
+        self.assertEqual(fetch_cover(self.book), NOT_MODIFIED)
+        self.assertEqual(CoverServer.requests[-1].get('If-None-Match'), '"v1"')
+
+    def test_changed_url_falls_back_to_remote_until_refetched(self):
+        fetch_cover(self.book)
+        self.book.refresh_from_db()
+        self.book.cover_image_url = f'{self.base_url}/other.png'
+        self.book.save()
+        self.assertEqual(self.book.get_cover_image(), self.book.cover_image_url)
+        self.assertIn(self.book, covers_to_refresh(timedelta(hours=24)))
+
+    def test_failed_fetch_keeps_remote_url(self):
+        self.book.cover_image_url = f'{self.base_url}/missing.jpg'
+        self.book.save()
+        self.assertEqual(fetch_cover(self.book), FAILED)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.get_cover_image(), self.book.cover_image_url)
+        self.assertNotIn(self.book, covers_to_refresh(timedelta(hours=24)))
+
+    def test_protocol_error_is_a_failed_fetch(self):
+        self.book.cover_image_url = f'{self.base_url}/garbled.png'
+        self.assertEqual(fetch_cover(self.book), FAILED)
+        self.book.refresh_from_db()
+        self.assertIsNotNone(self.book.cover_cache_checked_at)
+
+    def test_saving_does_not_fetch_in_the_request(self):
+        self.book.cover_image_url = f'{self.base_url}/other.png'
+        with mock.patch('admin_app.tasks.send_in_background', send_in_background), \
+                mock.patch('admin_app.tasks.threading.Thread') as thread, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(CoverServer.requests, [])
+        thread.return_value.start.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs['args'], (cache_remote_cover, self.book.pk))
+
+    def test_periodic_task_refreshes_due_covers(self):
+        self.assertEqual(cache_remote_covers(), {FETCHED: 1})
+        self.assertEqual(cache_remote_covers(), {})
+        self.assertIn('admin_app.tasks.cache_remote_covers', [
+            entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()
+        ])
+
+    def test_editing_after_a_failed_fetch_does_not_retry(self):
+        self.book.cover_image_url = f'{self.base_url}/missing.jpg'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(len(CoverServer.requests), 1)
+        self.book.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.price = 6
+            self.book.save()
+        self.assertEqual(len(CoverServer.requests), 1)
+        self.assertIsNotNone(self.book.cover_cache_checked_at)
+
+        self.book.cover_image_url = f'{self.base_url}/cover.png'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(len(CoverServer.requests), 2)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'FTS5 is SQLite specific')
+class SQLiteSearchTests(TestCase):
+
+    def setUp(self):
+        self.in_title = Book.objects.create(title='Dragonflight', author='Anne McCaffrey', price=5, description='Pern')
+        self.in_description = Book.objects.create(
+            title='Bestiary', author='Various', price=5, description='A field guide to the dragon and the wyvern',
+        )
+        self.other = Book.objects.create(title='Emma', author='Jane Austen', price=5, description='Highbury')
+        get_backend().rebuild(Book.objects.all())
+
+    def search(self, query):
+        return list(search_books(Book.objects.all(), query).order_by('-search_rank'))
+
+    def test_prefix_matching_on_every_term(self):
+        self.assertEqual(self.search('aust'), [self.other])
+        self.assertEqual(self.search('jane aus'), [self.other])
+        self.assertEqual(self.search('emma zzz'), [])
+        # Nothing searchable left after dropping FTS syntax
+        self.assertFalse(search_books(Book.objects.all(), '"*').exists())
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('drag'), [self.in_title, self.in_description])
+
+    def test_rebuild_search_index_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {SQLITE_TABLE}')
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 books with SQLiteSearchBackend', out.getvalue())
+        self.assertEqual(self.search('wyvern'), [self.in_description])
+
+    def test_ranked_catalog_search_runs_one_match_per_query(self):
+        Book.objects.bulk_create(
+            Book(title=f'Dragon {number}', author='Author', price=5, description='x') for number in range(60)
+        )
+        get_backend().rebuild(Book.objects.all())
+        url = reverse('book_catalog') + '?query=dragon'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        ranks = [book.search_rank for book in response.context['books']]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        # A correlated rank subquery would re-run the MATCH for every matching row
+        matching = [query['sql'] for query in queries if 'MATCH' in query['sql']]
+        self.assertTrue(matching)
+        for sql in matching:
+            self.assertEqual(sql.count('MATCH'), 1, sql)
+
+        page = response.context['page']
+        response = self.client.get(f'{url}&cursor={page.next_cursor}')
+        seen = {book.pk for book in page} | {book.pk for book in response.context['books']}
+        self.assertEqual(len(seen), len(page) + len(response.context['books']))
+
+
+class SearchIndexTaskTests(TestCase):
+
+    def test_index_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='Leviathan Wakes', author='Corey', price=5, description='Space')
+        self.assertEqual(list(search_books(Book.objects.all(), 'levia')), [book])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.title = 'Caliban War'
+            book.save()
+        self.assertEqual(list(search_books(Book.objects.all(), 'levia')), [])
+        self.assertEqual(list(search_books(Book.objects.all(), 'caliban')), [book])
+
+        sync_search_index([book.pk])  # repeated deliveries are harmless
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertEqual(list(search_books(Book.objects.all(), 'caliban')), [])
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        self.cart = Cart.objects.create(user=self.user)
+        self.first = Book.objects.create(title='First', author='A', price=10, description='x', stock_quantity=3)
+        self.second = Book.objects.create(title='Second', author='A', price=4, description='x', stock_quantity=1)
+
+    def fill_cart(self, *lines):
+        for book, quantity in lines:
+            CartItem.objects.create(cart=self.cart, book=book, quantity=quantity)
+
+    def stock(self):
+        return list(Book.objects.order_by('id').values_list('stock_quantity', flat=True))
+
+    def test_checkout_reserves_stock(self):
+        self.fill_cart((self.first, 2), (self.second, 1))
+        order = checkout(self.cart)
+        self.assertEqual(order.total_price, Decimal('24.00'))
+        self.assertEqual(self.stock(), [1, 0])
+        self.assertFalse(self.cart.cart_items.exists())
+
+    def test_shortage_rolls_back_everything(self):
+        self.fill_cart((self.first, 2), (self.second, 2))
+        with self.assertRaises(OutOfStock):
+            checkout(self.cart)
+        self.assertEqual(self.stock(), [3, 1])
+        self.assertEqual(self.cart.cart_items.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_release_expired_returns_stock(self):
+        self.fill_cart((self.first, 2), (self.second, 1))
+        order = checkout(self.cart, hold=timedelta(minutes=5))
+        self.assertEqual(release_expired(), 0)
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(minutes=6)), 1)
+        self.assertEqual(self.stock(), [3, 1])
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.EXPIRED)
+        self.assertFalse(confirm_order(order))
+
+    def test_confirmed_order_keeps_stock(self):
+        self.fill_cart((self.first, 1),)
+        order = checkout(self.cart)
+        self.assertTrue(confirm_order(order))
+        self.assertFalse(cancel_order(order))
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(self.stock(), [2, 1])
+
+
+    def test_deleting_an_ordered_book_hides_it(self):
+        self.fill_cart((self.first, 1),)
+        checkout(self.cart)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('delete_book', args=[self.first.id]))
+        self.assertRedirects(response, reverse('book_list'))
+        self.assertIn('marked unavailable instead of deleted', str(list(get_messages(response.wsgi_request))[0]))
+        self.first.refresh_from_db()
+        self.assertFalse(self.first.is_available)
+
+        self.client.post(reverse('delete_book', args=[self.second.id]))
+        self.assertFalse(Book.objects.filter(id=self.second.id).exists())
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+
+    def test_concurrent_checkouts_never_oversell(self):
+        book = Book.objects.create(title='Hot', author='A', price=10, description='x', stock_quantity=5)
+        carts = []
+        for index in range(20):
+            cart = Cart.objects.create(user=User.objects.create_user(f'buyer{index}'))
+            CartItem.objects.create(cart=cart, book=book, quantity=1)
+            carts.append(cart)
+        barrier = threading.Barrier(len(carts))
+        results = []
+
+        def buy(cart):
+            try:
+                barrier.wait()
+                try:
+                    checkout(cart)
+                    results.append('ok')
+                except OutOfStock:
+                    results.append('out')
+                except Exception as exc:
+                    results.append(repr(exc))
+            finally:
+                db_connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        book.refresh_from_db()
+        self.assertEqual(sorted(set(results)), ['ok', 'out'])
+        self.assertEqual(results.count('ok'), 5)
+        self.assertEqual(book.stock_quantity, 0)
+        self.assertEqual(OrderItem.objects.filter(book=book).count(), 5)
+
+
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        self.books = [
+            Book.objects.create(title=f'Book {index}', author='A', price=5, description='x') for index in range(4)
+        ]
+        self.users = [User.objects.create_user(f'reader{index}') for index in range(3)]
+
+    def like(self, user, *books):
+        wishlist, created = Wishlist.objects.get_or_create(user=user)
+        wishlist.books.add(*books)
+
+    def test_neighbors_follow_cooccurrence(self):
+        first, second, third, fourth = self.books
+        self.like(self.users[0], first, second)
+        self.like(self.users[1], first, second, third)
+        Review.objects.create(book=fourth, user=self.users[2], rating=1, comment='No')
+        self.like(self.users[2], first)
+        self.assertEqual(rebuild_recommendations(), (3, 2))
+        neighbors = list(BookNeighbor.objects.filter(book=first).values_list('neighbor_id', flat=True))
+        self.assertEqual(neighbors, [second.id, third.id])
+        # Low ratings are not a "like", so the fourth book never co-occurs
+        self.assertFalse(BookNeighbor.objects.filter(neighbor=fourth).exists())
+        recommended = UserRecommendation.objects.filter(user=self.users[0]).values_list('book_id', flat=True)
+        self.assertEqual(list(recommended), [third.id])
+
+    def test_book_detail_shows_neighbors(self):
+        first, second, third, fourth = self.books
+        self.like(self.users[0], first, fourth)
+        rebuild_recommendations()
+        response = self.client.get(reverse('book_detail', args=[first.id]))
+        self.assertEqual(list(response.context['related_books']), [fourth])
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', price=9, description='x')
+        self.messiah = Book.objects.create(title='Dune Messiah', author='Frank Herbert', price=9, description='x')
+        self.emma = Book.objects.create(title='Emma', author='Jane Austen', price=5, description='x')
+        autocomplete.rebuild()
+        # A worker that has finished loading the snapshot
+        autocomplete._current = autocomplete._load()
+
+    def titles(self, query):
+        return [book['title'] for book in autocomplete.suggest(query)]
+
+    def test_prefix_matches_titles_words_and_authors(self):
+        self.assertEqual(self.titles('du'), ['Dune', 'Dune Messiah'])
+        self.assertEqual(self.titles('MESS'), ['Dune Messiah'])
+        self.assertEqual(self.titles('jane'), ['Emma'])
+        self.assertEqual(self.titles('e'), [])
+
+    def test_lookups_skip_the_database(self):
+        autocomplete.suggest('du')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('autocomplete'), {'q': 'emm'})
+        self.assertEqual(response.json()['results'], [{'id': self.emma.id, 'title': 'Emma', 'author': 'Jane Austen'}])
+
+    def test_book_changes_patch_the_index_in_place(self):
+        index = autocomplete.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.emma.title = 'Émile'
+            self.emma.save()
+            self.dune.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('emi'), ['Émile'])
+        self.assertEqual(self.titles('emma'), [])
+        self.assertEqual(self.titles('dune'), ['Dune Messiah'])
+        self.assertIs(autocomplete.get_index(), index)
+
+    def test_new_generation_loads_in_the_background(self):
+        self.assertEqual(self.titles('emm'), ['Emma'])
+        Book.objects.filter(pk=self.emma.pk).update(title='Emmanuelle')
+        autocomplete.rebuild()
+        gate = threading.Event()
+        load = autocomplete._load
+        with mock.patch.object(autocomplete, '_load', lambda: gate.wait(5) and load()):
+            # The old index answers while the new one is built
+            self.assertEqual(self.titles('emm'), ['Emma'])
+            loader = autocomplete._loader
+            gate.set()
+            loader.join()
+        self.assertEqual(self.titles('emm'), ['Emmanuelle'])
+
+    def test_cold_cache_never_queries_in_the_request(self):
+        cache.clear()
+        autocomplete._current = (None, 0, None)
+        with mock.patch.object(autocomplete, '_schedule_rebuild') as schedule, self.assertNumQueries(0):
+            self.assertEqual(self.titles('du'), [])
+        schedule.assert_called()
+
+    def test_busy_lock_defers_to_its_holder(self):
+        cache.set(autocomplete.LOCK_KEY, 'another worker')
+        with mock.patch.object(autocomplete, '_schedule_rebuild') as schedule:
+            autocomplete.update_books([self.emma.pk])
+            self.assertIsNone(autocomplete.rebuild())
+            # Neither waited for the lock nor released someone else's
+            self.assertEqual(cache.get(autocomplete.LOCK_KEY), 'another worker')
+            self.assertTrue(cache.get(autocomplete.PENDING_KEY))
+            schedule.assert_not_called()
+
+            # The holder rebuilds for them once it lets go
+            cache.delete(autocomplete.LOCK_KEY)
+            with autocomplete._snapshot_lock() as acquired:
+                self.assertTrue(acquired)
+            schedule.assert_called_once()
+        self.assertIsNone(cache.get(autocomplete.LOCK_KEY))
+        autocomplete.rebuild()
+        self.assertIsNone(cache.get(autocomplete.PENDING_KEY))
+
+    def test_old_generation_is_rebuilt_without_a_shared_cache(self):
+        old = time.time_ns() - 61 * 10**9
+        cache.set(autocomplete.HEAD_KEY, [old, 0])
+        autocomplete._current = (old, 0, autocomplete._current[2])
+        with mock.patch.object(autocomplete, '_schedule_rebuild') as schedule:
+            with override_settings(AUTOCOMPLETE_CACHE_TIMEOUT=None):
+                self.assertEqual(self.titles('emm'), ['Emma'])
+            schedule.assert_not_called()
+            with override_settings(AUTOCOMPLETE_CACHE_TIMEOUT=60):
+                self.assertEqual(self.titles('emm'), ['Emma'])
+            schedule.assert_called_once()
+
+
+class PerformanceMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        Book.objects.create(title='Measured', author='A', price=5, description='x')
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book_catalog'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+$')
+        self.assertIn(f'"{len(queries)} queries"', timing)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('book_catalog'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.force_login(self.admin)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'http_request_db_queries_count\{view="book_catalog",method="GET"\} [1-9]')
+        self.assertRegex(body, r'http_responses_total\{view="book_catalog",method="GET",status="200"\} [1-9]')
+
+
+class BenchmarkCommandTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def generate(self, **options):
+        call_command('generate_catalog', books=40, categories=3, users=4, stdout=StringIO(), **options)
+
+    def test_generate_catalog_is_deterministic(self):
+        self.generate()
+        first = list(Book.objects.order_by('id').values_list('title', 'price', 'average_rating'))
+        self.assertEqual(len(first), 40)
+        self.assertEqual(Review.objects.count(), 4 * 5)
+        with self.assertRaises(CommandError):
+            self.generate()
+        self.generate(clear=True)
+        self.assertEqual(list(Book.objects.order_by('id').values_list('title', 'price', 'average_rating')), first)
+
+    def test_clear_skips_per_book_side_effects(self):
+        self.generate()
+        with mock.patch('admin_app.signals.enqueue') as enqueue:
+            self.generate(clear=True)
+        tasks = [call.args[0] for call in enqueue.call_args_list]
+        self.assertNotIn(sync_search_index, tasks)
+        # The single rebuild afterwards dropped the deleted books from the index
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {SQLITE_TABLE}')
+            self.assertEqual({row[0] for row in cursor.fetchall()}, set(Book.objects.values_list('id', flat=True)))
+        # The receivers are back for everything else
+        with mock.patch('admin_app.signals.enqueue') as enqueue:
+            Book.objects.order_by('id').first().delete()
+        self.assertIn(sync_search_index, [call.args[0] for call in enqueue.call_args_list])
+
+    def test_baseline_flags_regressions(self):
+        self.generate()
+        baseline = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(baseline))
+        options = {'iterations': 2, 'warmup': 1, 'only': ['book_catalog', 'dashboard'], 'stdout': StringIO()}
+        call_command('run_benchmarks', save_baseline=baseline, **options)
+        with open(baseline) as handle:
+            results = json.load(handle)
+        self.assertEqual(set(results), {'book_catalog', 'dashboard'})
+        self.assertGreater(results['dashboard']['queries'], 0)
+
+        results['dashboard']['queries'] -= 1
+        with open(baseline, 'w') as handle:
+            json.dump(results, handle)
+        with self.assertRaisesMessage(CommandError, 'dashboard:'):
+            call_command('run_benchmarks', baseline=baseline, tolerance=1000, **options)
+
+        # The benchmark's admin account is generated data as well
+        self.assertTrue(User.objects.filter(username='bench_user_admin', is_superuser=True).exists())
+        self.generate(clear=True)
+        self.assertFalse(User.objects.filter(username='bench_user_admin').exists())
+
+
+class SlowQueryLogTests(TestCase):
+
+    def setUp(self):
+        Book.objects.create(title='Slow', author='A', price=5, description='x')
+
+    def test_fingerprints_ignore_literals_and_in_list_length(self):
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (?) AND name = ? LIMIT ?',
+        )
+        self.assertEqual(fingerprint('SELECT a FROM t WHERE id IN (%s)'), fingerprint('SELECT a FROM t WHERE id IN (%s, %s)'))
+        self.assertNotEqual(fingerprint('SELECT a FROM t'), fingerprint('SELECT b FROM t'))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_RATE=1)
+    def test_logs_view_stack_and_plan(self):
+        with self.assertLogs('admin_app.slow_queries', 'INFO') as logs:
+            response = self.client.get(reverse('book_catalog'))
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        # EXPLAIN runs outside the request's execute wrappers
+        self.assertIn(f'"{len(entries)} queries"', response['Server-Timing'])
+        entry = next(entry for entry in entries if 'admin_app_book' in entry['sql'])
+        self.assertEqual(entry['view'], 'book_catalog')
+        self.assertEqual(entry['fingerprint'], fingerprint(entry['sql']))
+        self.assertIn('user_app/views.py', ' '.join(entry['stack']))
+        self.assertNotIn('admin_app/metrics.py', ' '.join(entry['stack']))
+        self.assertTrue(entry['plan'])
+        self.assertFalse(entry['plan'][0].startswith('EXPLAIN failed'))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+    def test_disabled(self):
+        with self.assertNoLogs('admin_app.slow_queries'):
+            self.client.get(reverse('book_catalog'))
+
+    def test_report_groups_by_fingerprint(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'slow.jsonl')
+        with open(path, 'w') as handle:
+            for ids, duration in (('%s', 120), ('%s, %s', 300)):
+                sql = f'SELECT * FROM admin_app_book WHERE id IN ({ids})'
+                handle.write(json.dumps({
+                    'fingerprint': fingerprint(sql), 'duration_ms': duration, 'view': 'dashboard',
+                    'sql': sql, 'stack': ['user_app/views.py:1 in dashboard'], 'plan': ['SCAN admin_app_book'],
+                }) + '\n')
+            handle.write('not json\n')
+        out = StringIO()
+        call_command('slow_query_report', path, stdout=out)
+        output = out.getvalue()
+        self.assertIn('2 queries, total 420.0ms', output)
+        self.assertIn('dashboard (2)', output)
+        self.assertIn('plan:  SCAN admin_app_book', output)
+        self.assertIn('1 fingerprints from 1 file(s), 1 malformed lines skipped', output)
@@ -26,4 +26,6 @@ urlpatterns = [
     path('add_category/', views.add_category, name='add_category'),
     path('edit_book/<int:id>/', views.edit_book, name='edit_book'),
     path('delete_book/<int:id>/', views.delete_book, name='delete_book'),
+    path('export/', views.export_books, name='export_books'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
@@ -2,10 +2,18 @@ from urllib import request
 from django.shortcuts import render,redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
+from django.db.models import Count, ProtectedError, Q
+from django.http import HttpResponse, StreamingHttpResponse
 
 # Create your views here.
 from .models import Book, Category
 from .forms import *
+from .export import FORMATS, iter_export
+from .isbn import normalize_isbn
+from .metrics import registry
+from .pagination import paginate
+
+BOOK_LIST_PAGE_SIZE = 50
 
 def is_admin(user):
     return user.is_superuser
@@ -14,25 +22,22 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     """Enhanced admin dashboard with comprehensive stats"""
-    total_books = Book.objects.count()
-    total_categories = Category.objects.count()
-    featured_books = Book.objects.filter(is_featured=True).count()
-    out_of_stock = Book.objects.filter(stock_quantity=0).count()
-    recent_books = Book.objects.all()[:5]  # Latest 5 books
+    stats = Book.objects.aggregate(
+        total_books=Count('id'),
+        featured_books=Count('id', filter=Q(is_featured=True)),
+        out_of_stock=Count('id', filter=Q(stock_quantity=0)),
+    )
+    recent_books = Book.objects.select_related('category')[:5]  # Latest 5 books
     
-    # Book stats by category
-    category_stats = []
-    for category in Category.objects.all():
-        category_stats.append({
-            'category': category,
-            'count': Book.objects.filter(category=category).count()
-        })
+    # Book stats by category, counted in one grouped query
+    categories = list(Category.objects.annotate(num_books=Count('book')))
+    category_stats = [{'category': category, 'count': category.num_books} for category in categories]
     
     context = {
-        'total_books': total_books,
-        'total_categories': total_categories,
-        'featured_books': featured_books,
-        'out_of_stock': out_of_stock,
+        'total_books': stats['total_books'],
+        'total_categories': len(categories),
+        'featured_books': stats['featured_books'],
+        'out_of_stock': stats['out_of_stock'],
         'recent_books': recent_books,
         'category_stats': category_stats,
     }
@@ -53,18 +58,24 @@ def book_list(request):
     search_query = request.GET.get('search', '')
     category_filter = request.GET.get('category', '')
     
-    books = Book.objects.all()
+    books = Book.objects.select_related('category')
     
     if search_query:
-        books = books.filter(title__icontains=search_query)
+        isbn = normalize_isbn(search_query)
+        if isbn:
+            books = books.filter(isbn=isbn)
+        else:
+            books = books.filter(title__icontains=search_query)
     
     if category_filter:
         books = books.filter(category__id=category_filter)
     
     categories = Category.objects.all()
+    page = paginate(books, '', request.GET.get('cursor'), per_page=BOOK_LIST_PAGE_SIZE)
     
     context = {
-        'books': books,
+        'books': page.object_list,
+        'page': page,
         'categories': categories,
         'search_query': search_query,
         'category_filter': category_filter,
@@ -73,7 +84,7 @@ def book_list(request):
 
 
 def category_list(request):
-    cat=Category.objects.all()
+    cat=Category.objects.annotate(num_books=Count('book'))
     return render (request,'category_list.html',{'cat':cat})
 
 
@@ -105,7 +116,38 @@ def edit_book(request, id):
 def delete_book(request, id):
     book = get_object_or_404(Book, id=id)
     if request.method == 'POST':
-        book.delete()
-        messages.success(request, f'"{book.title}" has been deleted successfully!')
+        try:
+            book.delete()
+        except ProtectedError:
+            # Order history keeps its books; hide it from the store instead
+            book.is_available = False
+            book.save(update_fields=['is_available', 'updated_at'])
+            messages.warning(request, f'"{book.title}" appears in past orders, so it has been marked unavailable instead of deleted.')
+        else:
+            messages.success(request, f'"{book.title}" has been deleted successfully!')
         return redirect('book_list')
     return render(request, 'confirm_delete.html', {'book': book})
+
+
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+def export_books(request):
+    """Stream the whole catalogue as CSV or JSONL, optionally gzip'd"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        fmt = 'csv'
+    compress = request.GET.get('gzip') == '1'
+    filename = f'books.{fmt}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        iter_export(fmt, compress=compress),
+        content_type='application/gzip' if compress else FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+def metrics(request):
+    """Per-view request metrics in the Prometheus text format"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,15 @@
+"""
+Celery application for oneline_book_store project.
+
+Workers are started with ``celery -A oneline_book_store worker``. Without a
+broker configured the tasks run eagerly in-process (see CELERY_* settings).
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oneline_book_store.settings')
+
+app = Celery('oneline_book_store')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
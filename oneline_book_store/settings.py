@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'admin_app',
     'user_app',
 ]
@@ -44,11 +48,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # After WhiteNoise so static files are not measured
+    'admin_app.metrics.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'user_app.guest_cart.GuestCartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -79,9 +86,126 @@ DATABASES = {
     'default': { 
         'ENGINE': 'django.db.backends.sqlite3', 
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock at BEGIN and wait for it, so concurrent
+        # checkouts queue up instead of failing with "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file rather than shared-cache memory, whose table locks fail
+        # immediately instead of waiting; the checkout concurrency test needs it
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     } 
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set REDIS_URL to share the cache between workers.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bookstore',
+        }
+    }
+
+# Seconds a homepage fragment may be served before it is rebuilt even
+# without a catalogue change
+HOMEPAGE_CACHE_TIMEOUT = 600
+
+# Seconds a user's cached wishlist set lives. Wishlist changes delete it, but
+# only from the cache of the process that made them: with several workers on
+# local-memory caches, the others show stale hearts until it expires, so keep
+# it short unless Redis shares the cache.
+WISHLIST_CACHE_TIMEOUT = 60 * 60 if os.environ.get('REDIS_URL') else 30
+
+# Seconds the autocomplete snapshot and change log (admin_app/autocomplete.py)
+# live. With Redis every worker reads the others' changes from the log, so
+# they are kept until replaced; on local-memory caches a worker only sees its
+# own, so it rebuilds from the database this often to pick up the rest.
+AUTOCOMPLETE_CACHE_TIMEOUT = None if os.environ.get('REDIS_URL') else 5 * 60
+
+# Seconds facet counts for one filter combination are kept; catalogue changes
+# invalidate them sooner through the catalogue version
+FACET_CACHE_TIMEOUT = 600
+
+# Minutes a pending order holds its stock before the sweeper releases it
+ORDER_HOLD_MINUTES = 15
+
+# Slow-query log (admin_app/slow_queries.py): queries slower than this many
+# milliseconds during a request are logged as JSON lines to
+# SLOW_QUERY_LOG_FILE, and a sample of them is EXPLAINed. Set the variable
+# to an empty string to turn the log off.
+_slow_query_threshold = os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100')
+SLOW_QUERY_THRESHOLD_MS = float(_slow_query_threshold) if _slow_query_threshold else None
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE') or str(BASE_DIR / 'slow_queries.jsonl')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+            # Only create the file once something is slow
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'admin_app.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Celery
+# https://docs.celeryq.dev/en/stable/django/first-steps-with-django.html
+# Post-write side effects run on workers when a broker is configured and
+# eagerly in-process otherwise (development and tests).
+
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or os.environ.get('REDIS_URL')
+# Tasks bump the catalogue version and autocomplete log from the worker
+# process; on local-memory caches the web processes would never see it
+if CELERY_BROKER_URL and not os.environ.get('REDIS_URL'):
+    raise ImproperlyConfigured('CELERY_BROKER_URL needs REDIS_URL so workers and web processes share a cache')
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-orders': {
+        'task': 'admin_app.tasks.release_expired_orders',
+        'schedule': 60.0,
+    },
+    'cache-remote-covers': {
+        'task': 'admin_app.tasks.cache_remote_covers',
+        'schedule': 60 * 60.0,
+    },
+    'build-recommendations': {
+        'task': 'admin_app.tasks.build_recommendations',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -116,8 +240,6 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-import os
-
 STATIC_URL = '/static/' 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [
@@ -133,3 +255,13 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Read-only JSON API (user_app/api.py). JSON only: the browsable renderer
+# needs DRF's static files, and the API is public and cookie-free.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+    'UNAUTHENTICATED_USER': None,
+}
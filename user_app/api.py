@@ -0,0 +1,129 @@
+"""Read-only JSON API for the catalogue.
+
+Lists use the same keyset pagination as the HTML catalogue. Responses carry
+an ETag built from the catalogue cache version (bumped on every Book or
+Category change) and a Last-Modified taken from the time of that bump for
+lists, or from ``Book.updated_at`` for a single book, so unchanged resources
+are answered with a 304 before any serialisation.
+"""
+from datetime import datetime, timezone
+
+from django.db.models import Count
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from admin_app.caching import get_catalog_version
+from admin_app.forms import BookSearchForm
+from admin_app.models import Book, Category, Review
+from admin_app.pagination import paginate
+from admin_app.search import search_books
+
+from .serializers import BookSerializer, CategorySerializer, ReviewSerializer
+
+SORT_VALUES = {value for value, label in BookSearchForm.SORT_CHOICES if value}
+
+
+class KeysetCursorPagination(BasePagination):
+    """DRF adapter for admin_app.pagination; the view supplies the ordering"""
+    page_size = 24
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            per_page = min(int(request.query_params.get('page_size', self.page_size)), self.max_page_size)
+        except ValueError:
+            per_page = self.page_size
+        ordering = view.get_ordering() if view is not None else ''
+        self.request = request
+        self.page = paginate(queryset, ordering, request.query_params.get(self.cursor_query_param), max(per_page, 1))
+        return list(self.page.object_list)
+
+    def cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.cursor_link(self.page.next_cursor),
+            'previous': self.cursor_link(self.page.previous_cursor),
+            'results': data,
+        })
+
+
+def catalog_etag(request, *args, **kwargs):
+    return str(get_catalog_version())
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    # The version is the time_ns() of the last catalogue change. Unlike the
+    # newest updated_at it also moves when a book is deleted or a category
+    # edited.
+    return datetime.fromtimestamp(get_catalog_version() / 10**9, tz=timezone.utc)
+
+
+def book_last_modified(request, pk=None, *args, **kwargs):
+    return Book.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+
+conditional_list = method_decorator(condition(catalog_etag, catalog_last_modified), name='list')
+
+
+@conditional_list
+@method_decorator(condition(catalog_etag, book_last_modified), name='retrieve')
+@method_decorator(condition(catalog_etag, book_last_modified), name='reviews')
+class BookViewSet(viewsets.ReadOnlyModelViewSet):
+    """Available books; filter with ?q=, ?category=, ?min_price=, ?max_price=, sort with ?ordering="""
+    serializer_class = BookSerializer
+    pagination_class = KeysetCursorPagination
+
+    def get_queryset(self):
+        books = Book.objects.filter(is_available=True).select_related('category')
+        if self.action != 'list':
+            return books
+        params = self.request.query_params
+        if params.get('q'):
+            books = search_books(books, params['q'])
+        if params.get('category', '').isdigit():
+            books = books.filter(category_id=params['category'])
+        for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+            try:
+                if params.get(param):
+                    books = books.filter(**{lookup: float(params[param])})
+            except ValueError:
+                pass
+        return books
+
+    def get_ordering(self):
+        ordering = self.request.query_params.get('ordering', '')
+        if self.action == 'reviews':
+            return '-created_at'
+        if ordering in SORT_VALUES:
+            return ordering
+        return '-search_rank' if self.request.query_params.get('q') else ''
+
+    @action(detail=True)
+    def reviews(self, request, pk=None):
+        book = self.get_object()
+        reviews = Review.objects.filter(book=book).select_related('user')
+        page = self.paginate_queryset(reviews)
+        serializer = ReviewSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+
+@method_decorator(condition(etag_func=catalog_etag), name='list')
+@method_decorator(condition(etag_func=catalog_etag), name='retrieve')
+class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = CategorySerializer
+    pagination_class = KeysetCursorPagination
+    queryset = Category.objects.annotate(book_count=Count('book'))
+
+    def get_ordering(self):
+        return 'category_name'
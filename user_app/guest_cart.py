@@ -0,0 +1,98 @@
+"""Carts for visitors who are not logged in.
+
+A guest cart lives entirely in a signed cookie as ``"<book id>:<quantity>"``
+pairs, so browsing and adding to the cart never writes to the database. The
+first response after the visitor logs in merges it into their ``Cart`` with
+one bulk upsert and deletes the cookie (see ``GuestCartMiddleware``).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from admin_app.models import Book, Cart, CartItem
+
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'user_app.guest_cart'
+COOKIE_MAX_AGE = 30 * 24 * 60 * 60
+# Keeps the cookie well below the 4KB browsers accept
+MAX_LINES = 100
+MAX_QUANTITY = 99
+
+
+def decode(value):
+    lines = {}
+    for pair in value.split(','):
+        book_id, _, quantity = pair.partition(':')
+        if book_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+            lines[int(book_id)] = min(int(quantity), MAX_QUANTITY)
+    return lines
+
+
+def encode(lines):
+    return ','.join(f'{book_id}:{quantity}' for book_id, quantity in lines.items())
+
+
+def read(request):
+    """{book id: quantity} from the request's guest cart cookie"""
+    value = request.get_signed_cookie(COOKIE_NAME, default='', salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE)
+    return decode(value)
+
+
+def write(response, lines):
+    """Store ``lines`` on ``response``, or drop the cookie when empty"""
+    lines = {book_id: quantity for book_id, quantity in lines.items() if quantity > 0}
+    if not lines:
+        response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        return
+    lines = dict(list(lines.items())[-MAX_LINES:])
+    response.set_signed_cookie(
+        COOKIE_NAME, encode(lines), salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+    )
+
+
+def summary(lines):
+    """Same shape as ``Cart.get_summary()`` for a guest cart, in one query"""
+    prices = dict(Book.objects.filter(pk__in=list(lines)).values_list('id', 'price'))
+    lines = {book_id: quantity for book_id, quantity in lines.items() if book_id in prices}
+    return {
+        'total_items': sum(lines.values()),
+        'total_price': sum((prices[book_id] * quantity for book_id, quantity in lines.items()), Decimal('0.00')),
+    }
+
+
+def merge_into_cart(user, lines):
+    """Add guest ``lines`` to ``user``'s cart in one upsert; returns the cart"""
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        # Books may have been deleted since they were put in the cookie
+        book_ids = Book.objects.filter(pk__in=list(lines)).values_list('id', flat=True)
+        existing = {} if created else dict(
+            cart.cart_items.filter(book_id__in=list(lines)).values_list('book_id', 'quantity')
+        )
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=cart, book_id=book_id, quantity=existing.get(book_id, 0) + lines[book_id])
+                for book_id in book_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'book'],
+            update_fields=['quantity'],
+        )
+    return cart
+
+
+class GuestCartMiddleware:
+    """Merge a guest cart into the user's cart once they are logged in"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # Only touch request.user (and so the session) when a cookie is present
+        if COOKIE_NAME in request.COOKIES and request.user.is_authenticated:
+            lines = read(request)
+            if lines:
+                merge_into_cart(request.user, lines)
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        return response
@@ -0,0 +1,47 @@
+from rest_framework import serializers
+
+from admin_app.models import Book, Category, Review
+
+
+class SparseFieldsetMixin:
+    """Limit output to the comma-separated ``?fields=`` query parameter, if given"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested:
+            wanted = {name.strip() for name in requested.split(',')}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    book_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Category
+        fields = ['id', 'category_name', 'cat_description', 'book_count']
+
+
+class BookSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    category_name = serializers.CharField(source='category.category_name', read_only=True, default=None)
+    cover_image = serializers.CharField(source='get_cover_image', read_only=True)
+    in_stock = serializers.BooleanField(source='is_in_stock', read_only=True)
+
+    class Meta:
+        model = Book
+        fields = [
+            'id', 'title', 'author', 'isbn', 'category', 'category_name', 'price', 'original_price',
+            'description', 'cover_image', 'publisher', 'publication_date', 'pages', 'language',
+            'condition', 'in_stock', 'is_featured', 'average_rating', 'total_reviews', 'created_at',
+            'updated_at',
+        ]
+
+
+class ReviewSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    user = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = Review
+        fields = ['id', 'book', 'user', 'rating', 'title', 'comment', 'created_at']
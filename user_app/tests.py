@@ -1,3 +1,438 @@
-from django.test import TestCase
+import time
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from admin_app.models import Book, Cart, CartItem, Category, Order, Review, Wishlist, reconcile_ratings
+from admin_app.caching import CATALOG_VERSION_KEY, get_wishlisted_ids
+from admin_app.tasks import apply_review_rating
+
+from . import guest_cart
+
+
+class QueryBudgetMixin:
+    """Fail when a view's query count grows with the number of rows it renders"""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertQueriesIndependentOfRows(self, url, add_rows):
+        add_rows(2)
+        self.client.get(url)  # warm up lazily created carts, sessions, etc.
+        baseline = self.count_queries(url)
+        add_rows(5)
+        self.assertEqual(self.count_queries(url), baseline)
+
+
+class StorefrontQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'secret')
+        self.category = Category.objects.create(category_name='Fiction', cat_description='Stories')
+        self.book = Book.objects.create(
+            title='Anchor', author='Author', price=10, description='Anchor book', category=self.category
+        )
+        self.counter = 0
+
+    def make_book(self, **kwargs):
+        self.counter += 1
+        category = Category.objects.create(category_name=f'Category {self.counter}', cat_description='x')
+        defaults = {
+            'title': f'Book {self.counter}', 'author': 'Author', 'price': 5,
+            'description': 'A book', 'category': category,
+        }
+        defaults.update(kwargs)
+        return Book.objects.create(**defaults)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_home(self):
+        self.assertQueriesIndependentOfRows(
+            reverse('home'),
+            lambda n: [self.make_book(is_featured=True, average_rating=4.5) for _ in range(n)],
+        )
+
+    def test_book_catalog(self):
+        self.assertQueriesIndependentOfRows(
+            reverse('book_catalog'), lambda n: [self.make_book() for _ in range(n)]
+        )
+
+    def test_book_catalog_search(self):
+        self.assertQueriesIndependentOfRows(
+            reverse('book_catalog') + '?query=book&sort_by=price', lambda n: [self.make_book() for _ in range(n)]
+        )
+
+    def test_book_detail(self):
+        def add_reviews(n):
+            for _ in range(n):
+                self.counter += 1
+                user = User.objects.create_user(f'reviewer{self.counter}')
+                Review.objects.create(book=self.book, user=user, rating=4, comment='Good')
+                self.make_book(category=self.category)
+
+        self.assertQueriesIndependentOfRows(reverse('book_detail', args=[self.book.id]), add_reviews)
+
+    def test_dashboard(self):
+        self.client.force_login(self.user)
+        wishlist = Wishlist.objects.create(user=self.user)
+        cart = Cart.objects.create(user=self.user)
+
+        def add_rows(n):
+            for _ in range(n):
+                book = self.make_book()
+                wishlist.books.add(book)
+                CartItem.objects.create(cart=cart, book=book, quantity=2)
+                Review.objects.create(book=self.make_book(), user=self.user, rating=5, comment='Great')
+
+        self.assertQueriesIndependentOfRows(reverse('dashboard'), add_rows)
+
+
+class CartSummaryTests(TestCase):
+
+    def test_summary_in_one_query(self):
+        user = User.objects.create_user('shopper')
+        cart = Cart.objects.create(user=user)
+        for price, quantity in [('9.99', 2), ('15.50', 1), ('0.01', 3)]:
+            book = Book.objects.create(title=price, author='A', price=price, description='x')
+            CartItem.objects.create(cart=cart, book=book, quantity=quantity)
+
+        with self.assertNumQueries(1):
+            summary = cart.get_summary()
+        self.assertEqual(summary['total_items'], 6)
+        self.assertEqual(str(summary['total_price']), '35.51')
+
+    def test_empty_cart(self):
+        cart = Cart.objects.create(user=User.objects.create_user('browser'))
+        self.assertEqual(cart.get_total_items(), 0)
+        self.assertEqual(cart.get_total_price(), 0)
+
+
+class ReviewRatingTests(TestCase):
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Rated', author='A', price=5, description='x')
+
+    def post_review(self, username, rating):
+        self.client.force_login(User.objects.create_user(username))
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('book_detail', args=[self.book.id]), {'rating': rating, 'comment': 'ok'}
+            )
+
+    def test_review_updates_aggregates_incrementally(self):
+        self.post_review('first', 5)
+        self.post_review('second', 4)
+        self.post_review('third', 4)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.total_reviews, 3)
+        self.assertEqual(self.book.rating_sum, 13)
+        self.assertEqual(str(self.book.average_rating), '4.33')
+
+    def test_rating_task_is_idempotent(self):
+        self.post_review('first', 5)
+        review = Review.objects.get()
+        self.assertFalse(apply_review_rating(review.id))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_sum, self.book.total_reviews), (5, 1))
+
+    def test_reconcile_ratings_fixes_drift(self):
+        self.post_review('first', 3)
+        self.post_review('second', 2)
+        Book.objects.filter(pk=self.book.pk).update(rating_sum=0, total_reviews=7, average_rating=1)
+        self.assertEqual(reconcile_ratings(Book.objects.all(), Review.objects.all(), dry_run=True), 1)
+        self.assertEqual(reconcile_ratings(Book.objects.all(), Review.objects.all()), 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.rating_sum, self.book.total_reviews), (5, 2))
+        self.assertEqual(str(self.book.average_rating), '2.50')
+        self.assertEqual(reconcile_ratings(Book.objects.all(), Review.objects.all(), dry_run=True), 0)
+
+
+class HomepageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(
+            title='Cached Title', author='A', price=5, description='x', is_featured=True
+        )
+
+    def test_cached_homepage_skips_the_database(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Cached Title')
+
+    def test_book_change_invalidates_fragments(self):
+        self.client.get(reverse('home'))
+        self.book.title = 'Renamed Title'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Renamed Title')
+        self.assertNotContains(response, 'Cached Title')
+
+    def test_category_change_invalidates_fragments(self):
+        self.client.get(reverse('home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(category_name='Poetry', cat_description='Verse')
+        self.assertContains(self.client.get(reverse('home')), 'Poetry')
+
+
+class CatalogApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(category_name='Fiction', cat_description='Stories')
+        for index in range(5):
+            Book.objects.create(
+                title=f'Book {index}', author='Author', price=10 + index, description='x', category=self.category
+            )
+        self.book = Book.objects.first()
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(reverse('api-book-list'), {'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+
+    def test_cursor_pagination_walks_every_book(self):
+        seen = []
+        url = reverse('api-book-list') + '?ordering=price&page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            seen += [book['title'] for book in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [f'Book {index}' for index in range(5)])
+
+    def test_unchanged_list_returns_304(self):
+        response = self.client.get(reverse('api-book-list'))
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api-book-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_is_modified_by_deletes(self):
+        # A catalogue last changed a minute ago
+        cache.set(CATALOG_VERSION_KEY, time.time_ns() - 60 * 10**9, None)
+        last_modified = self.client.get(reverse('api-book-list'))['Last-Modified']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api-book-list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # The newest updated_at stays put when a book goes
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.order_by('updated_at').first().delete()
+        response = self.client.get(reverse('api-book-list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_detail_revalidates_after_change(self):
+        url = reverse('api-book-detail', args=[self.book.id])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.price = 99
+            self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['price'], '99.00')
+
+    def test_book_reviews(self):
+        user = User.objects.create_user('reader', 'reader@example.com', 'secret')
+        Review.objects.create(book=self.book, user=user, rating=4, comment='Good')
+        data = self.client.get(reverse('api-book-reviews', args=[self.book.id])).json()
+        self.assertEqual([review['user'] for review in data['results']], ['reader'])
+
+    def test_categories_include_book_count(self):
+        data = self.client.get(reverse('api-category-list')).json()
+        self.assertEqual(data['results'][0]['book_count'], 5)
+
+
+class CheckoutViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+        self.client.force_login(self.user)
+        self.book = Book.objects.create(title='Stocked', author='A', price=8, description='x', stock_quantity=1)
+
+    def test_checkout_and_confirm(self):
+        self.client.post(reverse('add_to_cart', args=[self.book.id]))
+        response = self.client.post(reverse('checkout'))
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('order_detail', args=[order.id]))
+        self.client.post(reverse('order_detail', args=[order.id]), {'action': 'confirm'})
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.CONFIRMED)
+
+    def test_out_of_stock_book_is_not_added(self):
+        Book.objects.filter(pk=self.book.pk).update(stock_quantity=0)
+        self.client.post(reverse('add_to_cart', args=[self.book.id]))
+        self.assertFalse(CartItem.objects.exists())
+
+
+class GuestCartTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+        self.first = Book.objects.create(title='First', author='A', price=8, description='x')
+        self.second = Book.objects.create(title='Second', author='A', price=5, description='x')
+
+    def test_guest_add_to_cart_only_reads(self):
+        self.client.post(reverse('add_to_cart', args=[self.first.id]))
+        with self.assertNumQueries(1):
+            self.client.post(reverse('add_to_cart', args=[self.first.id]))
+        self.client.post(reverse('add_to_cart', args=[self.second.id]))
+        request = RequestFactory().get('/')
+        request.COOKIES[guest_cart.COOKIE_NAME] = self.client.cookies[guest_cart.COOKIE_NAME].value
+        self.assertEqual(guest_cart.read(request), {self.first.id: 2, self.second.id: 1})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_login_merges_guest_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, book=self.first, quantity=1)
+        self.client.post(reverse('add_to_cart', args=[self.first.id]))
+        self.client.post(reverse('add_to_cart', args=[self.second.id]))
+        response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret'})
+        self.assertEqual(response.cookies[guest_cart.COOKIE_NAME].value, '')
+        self.assertEqual(
+            dict(cart.cart_items.values_list('book_id', 'quantity')), {self.first.id: 2, self.second.id: 1}
+        )
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies[guest_cart.COOKIE_NAME] = f'{self.first.id}:50'
+        self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret'})
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartEndpointTests(TestCase):
+    XHR = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+        self.book = Book.objects.create(title='Delta', author='A', price=7, description='x')
+
+    def test_add_returns_json_delta(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.book.id]), **self.XHR)
+        data = self.client.post(reverse('add_to_cart', args=[self.book.id]), **self.XHR).json()
+        self.assertEqual(data['line'], {'book_id': self.book.id, 'quantity': 2, 'line_total': '14.00'})
+        self.assertEqual(data['cart'], {'total_items': 2, 'total_price': '14.00'})
+
+    def test_add_is_post_only_and_capped(self):
+        url = reverse('add_to_cart', args=[self.book.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertFalse(CartItem.objects.exists())
+
+        self.client.post(url)
+        CartItem.objects.update(quantity=guest_cart.MAX_QUANTITY)
+        data = self.client.post(url, **self.XHR).json()
+        self.assertEqual(data['line']['quantity'], guest_cart.MAX_QUANTITY)
+
+    def test_add_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(reverse('add_to_cart', args=[self.book.id]))
+        self.assertEqual(response.status_code, 403)
+
+        page = client.get(reverse('book_detail', args=[self.book.id]))
+        token = page.context['csrf_token']
+        response = client.post(reverse('add_to_cart', args=[self.book.id]), {'csrfmiddlewaretoken': token})
+        self.assertRedirects(response, reverse('book_detail', args=[self.book.id]))
+
+    def test_set_quantity_and_remove(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.book.id]))
+        url = reverse('set_cart_quantity', args=[self.book.id])
+        self.assertEqual(self.client.post(url, {'quantity': 5}, **self.XHR).json()['line']['quantity'], 5)
+        self.assertEqual(self.client.post(url, {'quantity': 'x'}, **self.XHR).status_code, 400)
+        data = self.client.post(reverse('remove_from_cart', args=[self.book.id]), **self.XHR).json()
+        self.assertEqual(data['cart'], {'total_items': 0, 'total_price': '0.00'})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_guest_endpoints_use_the_cookie(self):
+        self.client.post(reverse('add_to_cart', args=[self.book.id]), **self.XHR)
+        data = self.client.post(reverse('set_cart_quantity', args=[self.book.id]), {'quantity': 3}, **self.XHR).json()
+        self.assertEqual(data['cart'], {'total_items': 3, 'total_price': '21.00'})
+        self.assertFalse(CartItem.objects.exists())
+
+
+class WishlistMembershipTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'secret')
+        self.client.force_login(self.user)
+        self.books = [
+            Book.objects.create(title=f'Wish {index}', author='A', price=5, description='x') for index in range(3)
+        ]
+        self.wishlist = Wishlist.objects.create(user=self.user)
+
+    def test_contains_uses_the_through_table(self):
+        self.wishlist.books.add(self.books[0])
+        with self.assertNumQueries(1):
+            self.assertTrue(self.wishlist.contains(self.books[0]))
+        self.assertFalse(self.wishlist.contains(self.books[1]))
+
+    def test_toggle_keeps_cached_ids_current(self):
+        self.assertEqual(get_wishlisted_ids(self.user.id), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('toggle_wishlist', args=[self.books[1].id]))
+        self.assertEqual(get_wishlisted_ids(self.user.id), {self.books[1].id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[1].wishlist_set.clear()
+        self.assertEqual(get_wishlisted_ids(self.user.id), set())
+
+    def test_catalog_marks_wishlisted_books_from_cache(self):
+        self.wishlist.books.add(self.books[2])
+        get_wishlisted_ids(self.user.id)
+        response = self.client.get(reverse('book_catalog'))
+        self.assertEqual(response.context['wishlisted_ids'], {self.books[2].id})
+        self.assertContains(response, 'title="In your wishlist"', count=1)
+
+
+class CatalogFacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fiction = Category.objects.create(category_name='Fiction', cat_description='Stories')
+        poetry = Category.objects.create(category_name='Poetry', cat_description='Verse')
+        for title, category, language, price in [
+            ('One', fiction, 'English', 8),
+            ('Two', fiction, 'French', 15),
+            ('Three', poetry, 'English', 30),
+            ('Four', poetry, 'English', 60),
+        ]:
+            Book.objects.create(
+                title=title, author='A', price=price, description='x', category=category, language=language
+            )
+        self.fiction, self.poetry = fiction, poetry
+
+    def options(self, response, name):
+        facet = next(facet for facet in response.context['facets'] if facet['name'] == name)
+        return {option['label']: option['count'] for option in facet['options']}
+
+    def test_counts_reflect_other_filters(self):
+        response = self.client.get(reverse('book_catalog'), {'language': 'English'})
+        self.assertEqual(len(response.context['books']), 3)
+        # Category counts are narrowed by language; language counts are not
+        self.assertEqual(self.options(response, 'category'), {'Poetry': 2, 'Fiction': 1})
+        self.assertEqual(self.options(response, 'language'), {'English': 3, 'French': 1})
+        self.assertEqual(self.options(response, 'price'), {'Under $10': 1, '$25 - $50': 1, '$50 & above': 1})
+
+    def test_options_within_a_facet_are_ored(self):
+        response = self.client.get(reverse('book_catalog'), {'price': ['under-10', '50-plus']})
+        self.assertEqual(sorted(book.title for book in response.context['books']), ['Four', 'One'])
+        self.assertEqual(self.options(response, 'category'), {'Fiction': 1, 'Poetry': 1})
+
+    def test_counts_are_cached_per_filter_signature(self):
+        self.client.get(reverse('book_catalog'), {'category': self.fiction.id})
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(reverse('book_catalog'), {'category': self.fiction.id})
+        with CaptureQueriesContext(connection) as fresh:
+            self.client.get(reverse('book_catalog'), {'category': self.poetry.id})
+        self.assertEqual(len(fresh) - len(cached), 6)
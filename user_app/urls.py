@@ -1,5 +1,11 @@
-from django.urls import path
-from . import views
+from django.urls import include, path
+from rest_framework.routers import SimpleRouter
+
+from . import api, views
+
+router = SimpleRouter()
+router.register('books', api.BookViewSet, basename='api-book')
+router.register('categories', api.CategoryViewSet, basename='api-category')
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -8,10 +14,16 @@ urlpatterns = [
     path('logout/', views.logout_user, name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('catalog/', views.book_catalog, name='book_catalog'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
     path('add-to-cart/<int:book_id>/', views.add_to_cart, name='add_to_cart'),
+    path('cart/<int:book_id>/quantity/', views.set_cart_quantity, name='set_cart_quantity'),
+    path('cart/<int:book_id>/remove/', views.remove_from_cart, name='remove_from_cart'),
     path('toggle-wishlist/<int:book_id>/', views.toggle_wishlist, name='toggle_wishlist'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('orders/<int:order_id>/', views.order_detail, name='order_detail'),
     path('session-login/', views.session_login, name='session_login'),
     path('session-dashboard/', views.session_dashboard, name='session_dashboard'),
     path('session-logout/', views.session_logout, name='session_logout'),
+    path('api/', include(router.urls)),
 ]
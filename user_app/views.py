@@ -1,12 +1,28 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Avg
+from django.db import IntegrityError, transaction
+from django.db.models import F, Count
+from django.db.models.functions import Least
 from django.http import HttpResponse, JsonResponse
-from admin_app.models import Book, Category, Cart, CartItem, Wishlist, Review
+from django.views.decorators.http import require_POST
+from admin_app.models import Book, Category, Cart, CartItem, Wishlist, Review, Order
 from admin_app.forms import BookSearchForm, ReviewForm
+from admin_app.caching import get_catalog_version, get_wishlisted_ids
+from admin_app.autocomplete import suggest
+from admin_app.facets import apply_facets, get_facets, selected_facets
+from admin_app.isbn import normalize_isbn
+from admin_app.orders import CheckoutError, cancel_order, checkout as place_order, confirm_order
+from admin_app.pagination import paginate
+from admin_app.search import search_books
+from admin_app.tasks import apply_review_rating, enqueue
+
+from . import guest_cart
+
+CATALOG_PAGE_SIZE = 24
 
 # Create your views here.
 def Register_user(request):
@@ -46,7 +62,7 @@ def home(request):
     featured_books = Book.objects.filter(is_featured=True, is_available=True)[:6]
     latest_books = Book.objects.filter(is_available=True).order_by('-created_at')[:8]
     top_rated_books = Book.objects.filter(is_available=True, average_rating__gte=4.0).order_by('-average_rating')[:6]
-    categories = Category.objects.all()[:6]
+    categories = Category.objects.annotate(num_books=Count('book'))[:6]
     
     # Search form
     search_form = BookSearchForm()
@@ -57,6 +73,10 @@ def home(request):
         'top_rated_books': top_rated_books,
         'categories': categories,
         'search_form': search_form,
+        # Fragments are cached per catalogue version, so the querysets above
+        # are only evaluated when a Book or Category changed
+        'catalog_version': get_catalog_version(),
+        'cache_timeout': settings.HOMEPAGE_CACHE_TIMEOUT,
     }
     return render(request, 'home.html', context)
 
@@ -64,24 +84,24 @@ def book_catalog(request):
     """Book catalog with search and filtering"""
     form = BookSearchForm(request.GET or None)
     books = Book.objects.filter(is_available=True)
+    ordering = ''
+    signature = {}
     
     if form.is_valid():
+        signature = {key: value for key, value in form.cleaned_data.items() if key != 'sort_by'}
         query = form.cleaned_data.get('query')
-        category = form.cleaned_data.get('category')
         min_price = form.cleaned_data.get('min_price')
         max_price = form.cleaned_data.get('max_price')
         sort_by = form.cleaned_data.get('sort_by')
         
         if query:
-            books = books.filter(
-                Q(title__icontains=query) |
-                Q(author__icontains=query) |
-                Q(isbn__icontains=query) |
-                Q(description__icontains=query)
-            )
-        
-        if category:
-            books = books.filter(category=category)
+            # Scanned or typed ISBNs resolve through the unique index straight to the book
+            isbn = normalize_isbn(query)
+            if isbn:
+                book_id = Book.objects.filter(isbn=isbn, is_available=True).values_list('id', flat=True).first()
+                if book_id:
+                    return redirect('book_detail', book_id=book_id)
+            books = search_books(books, query)
         
         if min_price:
             books = books.filter(price__gte=min_price)
@@ -90,20 +110,40 @@ def book_catalog(request):
             books = books.filter(price__lte=max_price)
         
         if sort_by:
-            books = books.order_by(sort_by)
+            ordering = sort_by
+        elif query:
+            ordering = '-search_rank'
+    
+    # Facet counts are taken before the facets' own filters are applied
+    selected = selected_facets(request.GET)
+    facets = get_facets(books, selected, signature)
+    books = apply_facets(books, selected).select_related('category')
+    
+    page = paginate(books, ordering, request.GET.get('cursor'), per_page=CATALOG_PAGE_SIZE)
     
     context = {
-        'books': books,
+        'books': page.object_list,
+        'page': page,
         'form': form,
-        'categories': Category.objects.all(),
+        'facets': facets,
+        'wishlisted_ids': get_wishlisted_ids(request.user.id) if request.user.is_authenticated else set(),
     }
     return render(request, 'book_catalog.html', context)
 
+def autocomplete(request):
+    """Title and author suggestions for the search box, served from memory"""
+    response = JsonResponse({'results': suggest(request.GET.get('q', ''))})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
 def book_detail(request, book_id):
     """Detailed book view with reviews"""
-    book = get_object_or_404(Book, id=book_id)
-    reviews = book.reviews.all()[:10]
-    related_books = Book.objects.filter(category=book.category, is_available=True).exclude(id=book.id)[:4]
+    book = get_object_or_404(Book.objects.select_related('category'), id=book_id)
+    reviews = book.reviews.select_related('user')[:10]
+    # Precomputed neighbours (admin_app.recommendations), else the same category
+    related_books = list(
+        Book.objects.filter(neighbor_of__book=book, is_available=True).order_by('neighbor_of__rank')[:4]
+    ) or Book.objects.filter(category=book.category, is_available=True).exclude(id=book.id)[:4]
     
     # Review form for authenticated users
     review_form = ReviewForm() if request.user.is_authenticated else None
@@ -121,13 +161,10 @@ def book_detail(request, book_id):
             review = review_form.save(commit=False)
             review.book = book
             review.user = request.user
-            review.save()
-            
-            # Update book's average rating
-            avg_rating = book.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-            book.average_rating = round(avg_rating, 2)
-            book.total_reviews = book.reviews.count()
-            book.save()
+            with transaction.atomic():
+                review.save()
+                # Book's rating aggregates are updated in the background
+                enqueue(apply_review_rating, review.id)
             
             messages.success(request, "Your review has been added!")
             return redirect('book_detail', book_id=book.id)
@@ -138,6 +175,7 @@ def book_detail(request, book_id):
         'related_books': related_books,
         'review_form': review_form,
         'user_review': user_review,
+        'wishlisted_ids': get_wishlisted_ids(request.user.id) if request.user.is_authenticated else set(),
     }
     return render(request, 'book_detail.html', context)
 
@@ -149,48 +187,135 @@ def dashboard(request):
     wishlist, created = Wishlist.objects.get_or_create(user=request.user)
     
     # Get user's recent reviews
-    recent_reviews = Review.objects.filter(user=request.user)[:3]
+    recent_reviews = Review.objects.filter(user=request.user).select_related('book__category')[:3]
     
-    # Get recommendations based on user's reviews and wishlist
-    user_categories = set()
-    for review in recent_reviews:
-        if review.book.category:
-            user_categories.add(review.book.category)
+    # Precomputed recommendations (admin_app.recommendations) when the nightly
+    # job has seen this user
+    recommended_books = list(
+        Book.objects.filter(recommended_to__user=request.user, is_available=True)
+        .order_by('recommended_to__rank')[:6]
+    )
     
-    for book in wishlist.books.all():
-        if book.category:
-            user_categories.add(book.category)
+    if not recommended_books:
+        # Otherwise books from the categories of the user's reviews and
+        # wishlist; the wishlist itself is never loaded, only its categories
+        user_categories = {review.book.category_id for review in recent_reviews if review.book.category_id}
+        user_categories.update(
+            wishlist.books.exclude(category=None).values_list('category_id', flat=True).distinct()
+        )
+        
+        recommended_books = Book.objects.filter(
+            category__in=user_categories,
+            is_available=True
+        ).exclude(
+            wishlist=wishlist
+        )[:6] if user_categories else Book.objects.filter(is_featured=True)[:6]
     
-    recommended_books = Book.objects.filter(
-        category__in=user_categories,
-        is_available=True
-    ).exclude(
-        id__in=[book.id for book in wishlist.books.all()]
-    )[:6] if user_categories else Book.objects.filter(is_featured=True)[:6]
+    cart_summary = cart.get_summary()
+    recent_orders = Order.objects.filter(user=request.user)[:5]
     
     context = {
         'cart': cart,
         'wishlist': wishlist,
         'recent_reviews': recent_reviews,
         'recommended_books': recommended_books,
-        'cart_total': cart.get_total_price(),
-        'cart_items_count': cart.get_total_items(),
+        'cart_total': cart_summary['total_price'],
+        'cart_items_count': cart_summary['total_items'],
+        'recent_orders': recent_orders,
     }
     return render(request, 'dashboard.html', context)
 
-@login_required
+def _is_ajax(request):
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+def _change_cart(request, book, increment=0, quantity=None):
+    """Add ``increment`` copies of ``book`` or set its quantity (0 removes it).
+
+    Returns the line's new quantity and either the user's cart or, for
+    guests, the cookie lines to store on the response.
+    """
+    if not request.user.is_authenticated:
+        lines = guest_cart.read(request)
+        new_quantity = lines.get(book.id, 0) + increment if quantity is None else quantity
+        lines[book.id] = min(new_quantity, guest_cart.MAX_QUANTITY)
+        lines = {book_id: count for book_id, count in lines.items() if count > 0}
+        return lines.get(book.id, 0), None, lines
+    
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    items = CartItem.objects.filter(cart=cart, book=book)
+    if quantity is not None:
+        if quantity > 0:
+            CartItem.objects.update_or_create(cart=cart, book=book, defaults={'quantity': quantity})
+        else:
+            items.delete()
+    else:
+        # Capped like guest carts and set_cart_quantity
+        incremented = Least(F('quantity') + increment, guest_cart.MAX_QUANTITY)
+        if not items.update(quantity=incremented):
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(cart=cart, book=book, quantity=min(increment, guest_cart.MAX_QUANTITY))
+            except IntegrityError:
+                # A concurrent request created the line first
+                items.update(quantity=incremented)
+    new_quantity = items.values_list('quantity', flat=True).first() or 0
+    return new_quantity, cart, None
+
+def _cart_response(request, book, quantity, cart, lines, message):
+    """JSON delta for XHR requests, otherwise a redirect back to the book"""
+    if _is_ajax(request):
+        summary = cart.get_summary() if cart is not None else guest_cart.summary(lines)
+        response = JsonResponse({
+            'line': {'book_id': book.id, 'quantity': quantity, 'line_total': str(quantity * book.price)},
+            'cart': {'total_items': summary['total_items'], 'total_price': str(summary['total_price'])},
+            'message': message,
+        })
+    else:
+        messages.success(request, message)
+        response = redirect('book_detail', book_id=book.id)
+    if lines is not None:
+        guest_cart.write(response, lines)
+    return response
+
+@require_POST
 def add_to_cart(request, book_id):
-    """Add book to user's cart"""
+    """Add book to the user's cart, or to the guest cart cookie for visitors"""
     book = get_object_or_404(Book, id=book_id)
-    cart, created = Cart.objects.get_or_create(user=request.user)
     
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, book=book)
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    if not book.is_in_stock():
+        message = f"'{book.title}' is out of stock."
+        if _is_ajax(request):
+            return JsonResponse({'error': message}, status=409)
+        messages.error(request, message)
+        return redirect('book_detail', book_id=book.id)
     
-    messages.success(request, f"'{book.title}' added to your cart!")
-    return redirect('book_detail', book_id=book.id)
+    quantity, cart, lines = _change_cart(request, book, increment=1)
+    return _cart_response(request, book, quantity, cart, lines, f"'{book.title}' added to your cart!")
+
+@require_POST
+def set_cart_quantity(request, book_id):
+    """Set the quantity of a cart line; 0 removes it"""
+    book = get_object_or_404(Book, id=book_id)
+    try:
+        quantity = int(request.POST.get('quantity', ''))
+    except ValueError:
+        quantity = -1
+    if not 0 <= quantity <= guest_cart.MAX_QUANTITY:
+        message = f"Quantity must be between 0 and {guest_cart.MAX_QUANTITY}."
+        if _is_ajax(request):
+            return JsonResponse({'error': message}, status=400)
+        messages.error(request, message)
+        return redirect('book_detail', book_id=book.id)
+    
+    quantity, cart, lines = _change_cart(request, book, quantity=quantity)
+    return _cart_response(request, book, quantity, cart, lines, "Your cart was updated.")
+
+@require_POST
+def remove_from_cart(request, book_id):
+    """Remove a book from the cart"""
+    book = get_object_or_404(Book, id=book_id)
+    quantity, cart, lines = _change_cart(request, book, quantity=0)
+    return _cart_response(request, book, quantity, cart, lines, f"'{book.title}' removed from your cart.")
 
 @login_required
 def toggle_wishlist(request, book_id):
@@ -198,7 +323,7 @@ def toggle_wishlist(request, book_id):
     book = get_object_or_404(Book, id=book_id)
     wishlist, created = Wishlist.objects.get_or_create(user=request.user)
     
-    if book in wishlist.books.all():
+    if wishlist.contains(book):
         wishlist.books.remove(book)
         messages.info(request, f"'{book.title}' removed from your wishlist.")
         in_wishlist = False
@@ -207,12 +332,45 @@ def toggle_wishlist(request, book_id):
         messages.success(request, f"'{book.title}' added to your wishlist!")
         in_wishlist = True
     
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+    if _is_ajax(request):
         return JsonResponse({'in_wishlist': in_wishlist})
     
     return redirect('book_detail', book_id=book.id)
 
 
+@login_required
+@require_POST
+def checkout(request):
+    """Reserve stock for the cart's contents and create a pending order"""
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    try:
+        order = place_order(cart)
+    except CheckoutError as exc:
+        messages.error(request, str(exc))
+        return redirect('dashboard')
+    messages.success(request, f"Your books are reserved for {settings.ORDER_HOLD_MINUTES} minutes.")
+    return redirect('order_detail', order_id=order.id)
+
+@login_required
+def order_detail(request, order_id):
+    """Order summary with confirm and cancel actions while it is pending"""
+    order = get_object_or_404(Order, id=order_id, user=request.user)
+    if request.method == 'POST':
+        if request.POST.get('action') == 'confirm':
+            if confirm_order(order):
+                messages.success(request, "Thank you, your order is confirmed!")
+            else:
+                messages.error(request, "This order can no longer be confirmed.")
+        elif request.POST.get('action') == 'cancel' and cancel_order(order):
+            messages.info(request, "Your order was cancelled.")
+        return redirect('order_detail', order_id=order.id)
+    
+    context = {
+        'order': order,
+        'items': order.items.select_related('book'),
+    }
+    return render(request, 'order_detail.html', context)
+
 def session_login(request):
    if request.method == "POST":
        username = request.POST.get('username') 